@@ -0,0 +1,921 @@
+import os
+import io
+import re
+import sys
+import json
+import time
+import shutil
+import subprocess
+import asyncio
+import argparse
+import threading
+import datetime
+import tempfile
+import warnings
+import tracemalloc
+import contextlib
+from urllib.parse import urljoin, urlencode
+from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+
+import parser
+import process_data
+import regional
+import mapping
+import outputs
+import service
+import forecast
+import fake_customs
+
+BENCH_RESULTS = 'bench_results.jsonl'
+REGRESSION_TOLERANCE = 0.2
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+MAPPING_PATH = os.path.join(os.path.dirname(SRC_DIR), mapping.MAPPING_FILE)
+COLD_START_COMMANDS = {
+    'cold_start.cli_help': [os.path.join(SRC_DIR, 'cli.py'), '--help'],
+    'cold_start.cli_check': [os.path.join(SRC_DIR, 'cli.py'), 'check'],
+    'cold_start.import_process_data': ['-c', f"import sys; sys.path.insert(0, {SRC_DIR!r}); import process_data"],
+}
+FLOW_TITLES = {'import': 'Импорт', 'export': 'Экспорт'}
+MONTH_NAMES = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь',
+               'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь']
+MONTH_NAMES_GEN = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
+                   'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря']
+
+LEGACY_ENGINES = [None, 'xlrd', 'openpyxl']
+
+
+def legacy_read(filepath):
+    attempts = 0
+    for eng in LEGACY_ENGINES:
+        attempts += 1
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                pd.read_excel(filepath, header=None, engine=eng)
+            return attempts, True
+        except:
+            continue
+    return attempts, False
+
+
+def bench_format_sniffing(files):
+    legacy_attempts = 0
+    legacy_failed = 0
+    started = time.perf_counter()
+    for f in files:
+        attempts, ok = legacy_read(f)
+        legacy_attempts += attempts
+        if not ok: legacy_failed += 1
+    legacy_time = time.perf_counter() - started
+
+    sniffed_attempts = 0
+    sniffed_failed = 0
+    formats = {}
+    started = time.perf_counter()
+    for f in files:
+        fmt = process_data.detect_file_format(f)
+        formats[fmt] = formats.get(fmt, 0) + 1
+        if fmt not in ('missing', 'empty', 'unknown'):
+            sniffed_attempts += 1
+        df, error = process_data.read_excel_checked(f)
+        if df is None: sniffed_failed += 1
+    sniffed_time = time.perf_counter() - started
+
+    print(f"Файлов: {len(files)}, форматы: {formats}")
+    print(f"Перебор движков: попыток разбора {legacy_attempts}, не прочитано {legacy_failed}, {legacy_time:.2f} с")
+    print(f"Определение формата: попыток разбора {sniffed_attempts}, не прочитано {sniffed_failed}, {sniffed_time:.2f} с")
+    print(f"Сэкономлено полных разборов: {legacy_attempts - sniffed_attempts}")
+    return {
+        'files': len(files),
+        'legacy_attempts': legacy_attempts,
+        'sniffed_attempts': sniffed_attempts,
+        'legacy_seconds': legacy_time,
+        'sniffed_seconds': sniffed_time,
+    }
+
+
+def synthetic_regional_inputs(n_regions=85, n_products=8, years=range(2017, 2025), seed=0):
+    rng = np.random.default_rng(seed)
+    years = list(years)
+    
+    shares = rng.random((n_regions, len(years)))
+    shares = shares / shares.sum(axis=0) * 100
+    df_shares = pd.DataFrame(shares, columns=[str(y) for y in years])
+    df_shares.insert(0, regional.REGION_COL, [f"Регион {i}" for i in range(n_regions)])
+
+    keys = pd.MultiIndex.from_product([[f"Продукт {i}" for i in range(n_products)], years, range(1, 13)],
+                                      names=['Product', 'Year', 'Month']).to_frame(index=False)
+    keys['Demand'] = rng.random(len(keys)) * 1000
+    return keys[['Year', 'Month', 'Product', 'Demand']], df_shares
+
+
+def bench_regional_allocation(scale=10, repeat=3):
+    results = {}
+    for label, factor in [('1x', 1), (f'{scale}x', scale)]:
+        df_demand, df_shares = synthetic_regional_inputs(85 * factor, 8 * factor)
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            df_res = regional.allocate_demand(df_demand, df_shares)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"Региональное распределение {label}: регионов {df_shares.shape[0]}, "
+              f"строк спроса {len(df_demand)}, строк результата {len(df_res)}, {best:.3f} с")
+        results[label] = {'rows': len(df_res), 'seconds': best}
+    return results
+
+
+def legacy_electricity_shares(df):
+    df = df.iloc[2:].reset_index(drop=True)
+    df = df.iloc[:, [0] + list(range(13, 21))]
+    year_cols = list(parser.ELECTRICITY_YEAR_COLS)
+    df.columns = ['Регион'] + year_cols
+    for col in year_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['Регион'] = df['Регион'].astype(str).str.strip()
+    df = df[~df['Регион'].isin(parser.ELECTRICITY_SKIP_REGIONS)]
+    
+    merged_data = {}
+    for idx, row in df.iterrows():
+        region = row['Регион']
+        if pd.isna(region) or region == 'nan' or region == '':
+            continue
+        if region not in merged_data:
+            merged_data[region] = row.copy()
+        else:
+            for year in year_cols:
+                current_value = merged_data[region][year]
+                new_value = row[year]
+                if pd.isna(current_value) and not pd.isna(new_value):
+                    merged_data[region][year] = new_value
+                elif not pd.isna(current_value) and not pd.isna(new_value):
+                    merged_data[region][year] = current_value + new_value
+    
+    df_merged = pd.DataFrame(list(merged_data.values()))
+    mask = df_merged[year_cols].notna().any(axis=1) & (df_merged[year_cols] != 0).any(axis=1)
+    df_filtered = df_merged[mask].reset_index(drop=True)
+    
+    df_percent = df_filtered.copy()
+    for year in year_cols:
+        total = df_filtered[year].sum()
+        if total > 0:
+            df_percent[year] = (df_filtered[year] / total) * 100
+        else:
+            df_percent[year] = 0
+    for year in year_cols:
+        df_percent[year] = df_percent[year].round(4)
+    return df_percent
+
+
+def synthetic_electricity_sheet(n_rows=5000, n_regions=None, seed=0):
+    rng = np.random.default_rng(seed)
+    n_regions = n_regions or max(1, n_rows // 3)
+    names = [f"Регион {i}" for i in range(n_regions)] + parser.ELECTRICITY_SKIP_REGIONS + ['', None]
+    
+    regions = rng.choice(np.array(names, dtype=object), n_rows)
+    values = rng.random((n_rows, 20)) * 1000
+    values[rng.random(values.shape) < 0.1] = np.nan
+    df = pd.DataFrame(values, dtype=object)
+    df[rng.random(n_rows) < 0.02] = '-'
+    df.insert(0, 'region', regions)
+    df.columns = range(df.shape[1])
+    return pd.concat([pd.DataFrame([['Заголовок'] + [None] * 20, [None] * 21]), df], ignore_index=True)
+
+
+def bench_electricity_shares(n_rows=5000):
+    df_sheet = synthetic_electricity_sheet(n_rows)
+    
+    started = time.perf_counter()
+    df_legacy = legacy_electricity_shares(df_sheet)
+    legacy_time = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    df_new = parser.electricity_shares(df_sheet)
+    new_time = time.perf_counter() - started
+    
+    print(f"Доли электропотребления: строк листа {n_rows}, регионов {len(df_new)}")
+    print(f"  iterrows: {legacy_time:.3f} с, groupby: {new_time:.3f} с")
+    return {'rows': n_rows, 'legacy_seconds': legacy_time, 'seconds': new_time}
+
+
+def legacy_scale_thousands(df):
+    df = df.copy()
+    for i in range(3, len(df)):
+        for col in df.columns[1:]:
+            try:
+                value = df.at[i, col]
+                if pd.notna(value) and str(value).replace(',', '').replace('.', '').isdigit():
+                    numeric_value = float(str(value).replace(',', '.'))
+                    df.at[i, col] = numeric_value / 1000
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
+def synthetic_production_sheet(n_rows=400, n_months=96, seed=0):
+    rng = np.random.default_rng(seed)
+    cells = rng.random((n_rows, n_months)) * 100000
+    df = pd.DataFrame(cells.round(1), dtype=object)
+    kinds = rng.random(cells.shape)
+    df = df.mask(kinds < 0.05, '-')
+    df = df.mask((kinds >= 0.05) & (kinds < 0.10), '...')
+    df = df.mask((kinds >= 0.10) & (kinds < 0.15), np.nan)
+    text_numbers = (kinds >= 0.15) & (kinds < 0.30)
+    df = df.mask(text_numbers, pd.DataFrame(cells.round(1), dtype=object).astype(str).apply(lambda c: c.str.replace('.', ',', regex=False)))
+    df = df.mask((kinds >= 0.30) & (kinds < 0.32), '1.2.3')
+    df.insert(0, 'name', [f"Продукт {i}" for i in range(n_rows)])
+    df.columns = ['Наименование'] + [f"м{i}" for i in range(n_months)]
+    return df
+
+
+def bench_scale_thousands(path=None, n_rows=400):
+    if path:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            df = pd.read_excel(path, sheet_name="24")
+        df = df.iloc[2:].reset_index(drop=True)
+    else:
+        df = synthetic_production_sheet(n_rows)
+    
+    started = time.perf_counter()
+    df_legacy = legacy_scale_thousands(df)
+    legacy_time = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    df_new = parser.scale_thousands(df)
+    new_time = time.perf_counter() - started
+    
+    print(f"Перевод в тысячи: ячеек {df.shape[0] * (df.shape[1] - 1)}")
+    print(f"  цикл df.at: {legacy_time:.3f} с, векторно: {new_time:.3f} с")
+    return {'cells': df.shape[0] * (df.shape[1] - 1), 'legacy_seconds': legacy_time, 'seconds': new_time}
+
+
+def legacy_build_final_table(df_prod, data_imp, data_exp):
+    frames = [df_prod]
+    for data, type_name in [(data_imp, 'Import'), (data_exp, 'Export')]:
+        df = pd.DataFrame(data)
+        if not df.empty:
+            df = df.groupby(process_data.KEY_COLS, as_index=False)[type_name].sum()
+        frames.append(df)
+    dfs = [d for d in frames if not d.empty]
+    
+    df_final = dfs[0]
+    for df_next in dfs[1:]:
+        df_final = pd.merge(df_final, df_next, on=process_data.KEY_COLS, how='outer')
+    
+    for col in ['Production', 'Import', 'Export']:
+        if col not in df_final.columns: df_final[col] = None
+    df_final['Demand'] = df_final['Production'] + df_final['Import'] - df_final['Export']
+    df_final['Product'] = df_final['Product'].apply(process_data.clean_product_name)
+    df_final = df_final[df_final['Year'].between(2017, 2024)]
+    df_final = df_final.sort_values(by=['Product', 'Year', 'Month'])
+    return df_final[['Year', 'Month', 'Product', 'Production', 'Import', 'Export', 'Demand']]
+
+
+def synthetic_flow_records(n_products=1000, years=range(1995, 2025), per_key=3, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = pd.MultiIndex.from_product([[f"Продукт {i} (т)" for i in range(n_products)], list(years), range(1, 13)],
+                                      names=['Product', 'Year', 'Month']).to_frame(index=False)
+    df_prod = keys.sample(frac=0.9, random_state=seed)[['Year', 'Month', 'Product']]
+    df_prod['Production'] = rng.random(len(df_prod)) * 1000
+    df_prod.loc[rng.random(len(df_prod)) < 0.05, 'Production'] = np.nan
+    
+    flows = []
+    for type_name in ['Import', 'Export']:
+        records = keys.loc[keys.index.repeat(per_key)].sample(frac=0.5, random_state=seed)
+        records[type_name] = rng.random(len(records)) * 100
+        flows.append(records[['Year', 'Month', 'Product', type_name]].to_dict('records'))
+    return df_prod.reset_index(drop=True), flows[0], flows[1]
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_final_merge(n_products=1000, n_years=30):
+    df_prod, data_imp, data_exp = synthetic_flow_records(n_products, range(2025 - n_years, 2025))
+    
+    _, legacy_time, legacy_peak = measure(legacy_build_final_table, df_prod, data_imp, data_exp)
+    _, new_time, new_peak = measure(
+        lambda: process_data.build_final_table(df_prod, process_data.records_frame(data_imp),
+                                               process_data.records_frame(data_exp)))
+    
+    print(f"Сведение таблицы: продуктов {n_products}, лет {n_years}, записей импорта {len(data_imp)}, экспорта {len(data_exp)}")
+    print(f"  merge: {legacy_time:.3f} с, пик {legacy_peak / 2**20:.1f} МБ")
+    print(f"  groupby: {new_time:.3f} с, пик {new_peak / 2**20:.1f} МБ")
+    return {'legacy_seconds': legacy_time, 'seconds': new_time, 'legacy_peak': legacy_peak, 'peak': new_peak}
+
+
+def synthetic_mapping(n_entries=10000, n_products=500, seed=0):
+    rng = np.random.default_rng(seed)
+    entries = []
+    for i in range(n_entries):
+        product = f"Группа {rng.integers(n_products)}"
+        code = str(rng.integers(10**9, 10**10))[:rng.integers(4, 11)]
+        kind = rng.random()
+        if kind < 0.05:
+            entries.append((product, f"{code[:6].ljust(6, '0')}-{str(int(code[:6].ljust(6, '0')) + 50).zfill(6)}"))
+        elif kind < 0.10:
+            entries.append((product, f"кроме {code}"))
+        else:
+            entries.append((product, code))
+    return entries
+
+
+def bench_mapping_lookup(n_entries=10000, n_codes=50000, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = [str(c) for c in rng.integers(10**9, 10**10, n_codes)]
+    
+    results = {}
+    for label, entries in [(os.path.basename(MAPPING_PATH), mapping.load_mapping(MAPPING_PATH)),
+                           (f'{n_entries}', synthetic_mapping(n_entries, seed=seed))]:
+        started = time.perf_counter()
+        registry = mapping.compile_registry(entries)
+        build_time = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        matched = sum(1 for c in codes if process_data.match_code(c, registry))
+        lookup_time = time.perf_counter() - started
+        print(f"Справочник {label}: записей {len(entries)}, построение {build_time:.3f} с, "
+              f"{lookup_time / n_codes * 1e6:.1f} мкс на код, совпало {matched}")
+        results[label] = {'entries': len(entries), 'build_seconds': build_time, 'lookup_seconds': lookup_time}
+    
+    include_only = [(p, c) for p, c in synthetic_mapping(n_entries, seed=seed) if c.isdigit()]
+    bridge_map = {}
+    for product, code in include_only:
+        bridge_map.setdefault(product, []).append(code)
+    registry = mapping.compile_registry(mapping.entries_from_dict(bridge_map))
+    sample = codes[:2000] + [c + '12' for _, c in include_only[:2000]]
+    
+    started = time.perf_counter()
+    for c in sample:
+        tuple(p for p, targets in bridge_map.items() if process_data.is_code_match(c, targets))
+    legacy_time = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    for c in sample:
+        process_data.match_code(c, registry)
+    new_time = time.perf_counter() - started
+    print(f"Линейный перебор {len(include_only)} кодов: {legacy_time / len(sample) * 1e6:.1f} мкс на код, "
+          f"справочник: {new_time / len(sample) * 1e6:.1f} мкс на код")
+    results['linear'] = {'entries': len(include_only), 'legacy_seconds': legacy_time, 'seconds': new_time}
+    return results
+
+
+def write_workbook(rows, path):
+    if path.endswith('.xls'):
+        import xlwt
+        book = xlwt.Workbook(encoding='utf-8')
+        sheet = book.add_sheet('Лист1')
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                if value is not None:
+                    sheet.write(r, c, value)
+        book.save(path)
+    else:
+        import openpyxl
+        book = openpyxl.Workbook(write_only=True)
+        sheet = book.create_sheet('Лист1')
+        for row in rows:
+            sheet.append(row)
+        book.save(path)
+
+
+def synthetic_customs_rows(flow, year, month, n_rows, rng):
+    codes = [code for _, code in mapping.load_mapping(MAPPING_PATH)]
+    noise_codes = ['8401', '2701', '7601', '7403', '72', '7208-7212', '7301-7310', '2601-2603',
+                   '7305 (кроме 730511)', 'кроме 7201', 'Всего', '']
+    
+    if rng.random() < 0.5:
+        period = f"за {MONTH_NAMES[month - 1]} {year} года"
+    else:
+        period = f"в январе-{MONTH_NAMES_GEN[month - 1]} {year} г."
+    
+    lead = [None] if rng.random() < 0.3 else []
+    rows = [[f"{FLOW_TITLES[flow]} Российской Федерации важнейших товаров {period}"]]
+    rows += [[None]] * int(rng.integers(0, 6))
+    rows.append(lead + ['Код ТН ВЭД', 'Наименование товара', 'Единица измерения', f"{MONTH_NAMES[month - 1].capitalize()} {year}", None, None])
+    rows.append(lead + [None, None, None, 'тыс. тонн', 'млн долл. США', 'в % к соотв. периоду'])
+    
+    for _ in range(n_rows):
+        kind = rng.random()
+        if kind < 0.3:
+            code = codes[rng.integers(len(codes))] + str(rng.integers(0, 10 ** int(rng.integers(0, 7))))
+        elif kind < 0.4:
+            code = noise_codes[rng.integers(len(noise_codes))]
+        else:
+            code = str(rng.integers(10 ** 3, 10 ** 10))[:int(rng.integers(4, 11))]
+        
+        weight = round(float(rng.random()) * 500, 1)
+        shape = rng.random()
+        if shape < 0.4:
+            weight = str(weight).replace('.', ',')
+        elif shape < 0.5:
+            weight = f"{weight:,.1f}".replace(',', ' ').replace('.', ',')
+        elif shape < 0.55:
+            weight = '-'
+        elif shape < 0.6:
+            weight = None
+        rows.append(lead + [code, 'товар', 'тонна', weight, round(float(rng.random()) * 100, 2), 101.5])
+    return rows
+
+
+def synthetic_production_rows(n_extra_rows=100, years=range(2017, 2025), seed=0):
+    rng = np.random.default_rng(seed)
+    years = list(years)
+    n_periods = len(years) * 12
+    
+    names = list(process_data.load_code_matcher(MAPPING_PATH)['products']) + [f"Прочая продукция {i}, т" for i in range(n_extra_rows)]
+    rng.shuffle(names)
+    
+    rows = [['Производство основных видов продукции в натуральном выражении'] + [None] * n_periods,
+            [None] * (n_periods + 1),
+            ['Наименование'] + [f"{MONTH_NAMES[m]} {y}" for y in years for m in range(12)]]
+    for name in names:
+        values = (rng.random(n_periods) * 10000).round(1).tolist()
+        for i in np.flatnonzero(rng.random(n_periods) < 0.05):
+            values[i] = '-'
+        rows.append([name] + values)
+    return rows
+
+
+def build_synthetic_archive(root, years=range(2023, 2024), n_rows=500, xls_share=0.5, n_extra_products=100, seed=0):
+    rng = np.random.default_rng(seed)
+    files = {'xls': 0, 'xlsx': 0}
+    
+    for flow in FLOW_TITLES:
+        folder = os.path.join(root, process_data.BASE_DIR, flow)
+        os.makedirs(folder, exist_ok=True)
+        for year in years:
+            for month in range(1, 13):
+                ext = 'xls' if rng.random() < xls_share else 'xlsx'
+                rows = synthetic_customs_rows(flow, year, month, n_rows, rng)
+                write_workbook(rows, os.path.join(folder, f"{flow}_{year}_{month:02d}.{ext}"))
+                files[ext] += 1
+    
+    folder = os.path.join(root, process_data.BASE_DIR, 'production')
+    os.makedirs(folder, exist_ok=True)
+    write_workbook(synthetic_production_rows(n_extra_products, seed=seed), os.path.join(folder, 'Proizvodstvo_mes.xlsx'))
+    shutil.copy(MAPPING_PATH, os.path.join(root, process_data.MAPPING_FILE))
+    return files
+
+
+def best_time(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def cold_start_times(root, repeat=3):
+    results = {}
+    for name, command in COLD_START_COMMANDS.items():
+        results[name] = best_time(lambda: subprocess.run([sys.executable] + command, cwd=root, stdout=subprocess.DEVNULL,
+                                                         stderr=subprocess.DEVNULL), repeat)
+    return results
+
+
+def run_suite(root, repeat=3, electricity_rows=5000):
+    data_dir = os.path.join(root, process_data.BASE_DIR)
+    results = {}
+    
+    for ext in ('xls', 'xlsx'):
+        files = [f for flow in FLOW_TITLES for f in process_data.list_customs_files(os.path.join(data_dir, flow))
+                 if f.endswith('.' + ext)]
+        if files:
+            layouts = {}
+            seconds = best_time(lambda: [process_customs_file_quiet(f, layouts) for f in files], repeat)
+            results[f'process_customs_file.{ext}'] = seconds / len(files)
+    
+    prod_folder = os.path.join(data_dir, 'production')
+    products = process_data.load_code_matcher(MAPPING_PATH)['products']
+    results['process_production_folder'] = best_time(lambda: process_data.process_production_folder(prod_folder, products), repeat)
+    
+    df_sheet = synthetic_electricity_sheet(electricity_rows)
+    results['electricity_shares'] = best_time(lambda: parser.electricity_shares(df_sheet), repeat)
+    
+    df_thousands = synthetic_production_sheet()
+    results['scale_thousands'] = best_time(lambda: parser.scale_thousands(df_thousands), repeat)
+    
+    results.update(cold_start_times(root, repeat))
+    
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        results['main'] = best_time(lambda: process_data.main(workers=1, use_cache=False), 1)
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def process_customs_file_quiet(filepath, layouts):
+    type_name = 'Import' if 'import' in os.path.basename(filepath) else 'Export'
+    return process_data.process_customs_file(filepath, type_name, process_data.load_code_matcher(MAPPING_PATH), layouts)
+
+
+def load_bench_history(path=BENCH_RESULTS):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_with_previous(history, params, results, tolerance=REGRESSION_TOLERANCE):
+    previous = [run for run in history if run['params'] == params]
+    if not previous:
+        return []
+    baseline = previous[-1]['results']
+    return [(name, baseline[name], seconds) for name, seconds in results.items()
+            if name in baseline and seconds > baseline[name] * (1 + tolerance)]
+
+
+def bench_suite(root=None, years=1, n_rows=500, xls_share=0.5, repeat=3, results_path=BENCH_RESULTS,
+                tolerance=REGRESSION_TOLERANCE):
+    own_root = root is None
+    root = root or tempfile.mkdtemp(prefix='metal_bench_')
+    params = {'years': years, 'rows': n_rows, 'xls_share': xls_share}
+    try:
+        started = time.perf_counter()
+        files = build_synthetic_archive(root, range(2024 - years, 2024), n_rows, xls_share)
+        print(f"Синтетический архив {root}: файлов xls {files['xls']}, xlsx {files['xlsx']}, "
+              f"{time.perf_counter() - started:.1f} с")
+        results = run_suite(root, repeat)
+    finally:
+        if own_root:
+            shutil.rmtree(root, ignore_errors=True)
+    
+    history = load_bench_history(results_path)
+    regressions = compare_with_previous(history, params, results, tolerance)
+    for name, seconds in results.items():
+        print(f"  {name}: {seconds:.4f} с")
+    for name, before, after in regressions:
+        print(f"РЕГРЕССИЯ {name}: {before:.4f} с -> {after:.4f} с")
+    
+    with open(results_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'ts': datetime.datetime.now().isoformat(timespec='seconds'),
+                            'params': params, 'results': results}, ensure_ascii=False) + '\n')
+    return {'results': results, 'regressions': regressions}
+
+
+def legacy_find_excel_links(session, url, host):
+    response = session.get(url, timeout=15)
+    soup = BeautifulSoup(response.content, 'html.parser')
+    excel_links = []
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        if any(pattern in href for pattern in ['document_statistics_file', '.xlsx', '.xls']):
+            full_url = urljoin(host, href)
+            if full_url not in excel_links:
+                excel_links.append(full_url)
+    return excel_links
+
+
+def bench_listing_crawl(n_pages=300, per_page=20, workers=8):
+    server, host, _ = fake_customs.serve_fake_customs(n_pages, per_page, overlap=3)
+    base_url = f"{host}/folder/515"
+    session = parser.make_session(parser.BROWSER_HEADERS, pool_size=workers)
+    try:
+        started = time.perf_counter()
+        legacy = []
+        for page in range(1, n_pages + 1):
+            for u in legacy_find_excel_links(session, parser.listing_url(base_url, page), host):
+                if u not in legacy:
+                    legacy.append(u)
+        legacy_time = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            found = asyncio.run(parser.crawl_listing(session, parser.HostRateLimiter(0), base_url, host, workers))
+        new_time = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        server.server_close()
+    
+    print(f"Обход списка: страниц {n_pages}, ссылок {len(found)}")
+    print(f"  последовательно, html.parser: {legacy_time:.2f} с, asyncio + lxml: {new_time:.2f} с")
+    return {'pages': n_pages, 'links': len(found), 'legacy_seconds': legacy_time, 'seconds': new_time}
+
+
+def synthetic_query_sources(root, n_regions=85, n_products=8):
+    df_demand, df_shares = synthetic_regional_inputs(n_regions, n_products)
+    for col in ['Production', 'Import', 'Export']:
+        df_demand[col] = df_demand['Demand'] / 3
+    paths = {
+        'demand': os.path.join(root, regional.DEMAND_BASE + '.feather'),
+        'res': os.path.join(root, 'res.feather'),
+        'shares': None,
+    }
+    outputs.write_table(df_demand, paths['demand'][:-len('.feather')], ['feather'], outputs.DEMAND_DTYPES)
+    outputs.write_table(regional.allocate_demand(df_demand, df_shares), paths['res'][:-len('.feather')],
+                        ['feather'], regional.REGIONAL_DTYPES)
+    return paths, df_demand, df_shares
+
+
+def random_query(rng, axes):
+    years = axes['years']
+    year_from = int(rng.choice(years))
+    params = {'year_from': year_from, 'year_to': int(rng.integers(year_from, years[-1] + 1))}
+    path = list(service.ROUTES)[rng.integers(len(service.ROUTES))]
+    if 'products' in path:
+        params['product'] = list(rng.choice(axes['products'], int(rng.integers(1, 3)), replace=False))
+    if 'regions' in path:
+        params['region'] = list(rng.choice(axes['regions'], int(rng.integers(1, 6)), replace=False))
+    return path + '?' + urlencode(params, doseq=True)
+
+
+def bench_query_service(n_requests=2000, clients=8, n_regions=85, n_products=8, seed=0):
+    root = tempfile.mkdtemp(prefix='metal_service_')
+    try:
+        paths, _, _ = synthetic_query_sources(root, n_regions, n_products)
+        store = service.RollupStore(lambda: dict(paths), os.path.join(root, 'rollups'))
+        
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            arrays, axes = store.current()
+        build_time = time.perf_counter() - started
+        
+        server = service.make_server(store, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host = f"http://127.0.0.1:{server.server_port}"
+        
+        rng = np.random.default_rng(seed)
+        queries = [random_query(rng, axes) for _ in range(n_requests)]
+        
+        def fetch(query):
+            started = time.perf_counter()
+            with urlopen(host + query) as response:
+                payload = json.loads(response.read())
+            return time.perf_counter() - started, len(payload['rows'])
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            results = list(executor.map(fetch, queries))
+        total_time = time.perf_counter() - started
+        latencies = np.array([r[0] for r in results]) * 1000
+        server.shutdown()
+        server.server_close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    
+    print(f"Сервис запросов: товаров {len(axes['products'])}, регионов {len(axes['regions'])}, "
+          f"построение агрегатов {build_time:.2f} с")
+    print(f"  запросов {n_requests}, клиентов {clients}: {n_requests / total_time:.0f} запр/с, "
+          f"p50 {np.percentile(latencies, 50):.1f} мс, p95 {np.percentile(latencies, 95):.1f} мс, "
+          f"p99 {np.percentile(latencies, 99):.1f} мс")
+    return {'rps': n_requests / total_time, 'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99))}
+
+
+def legacy_detect_layout(df):
+    header_row_idx, code_col_idx = None, None
+    for idx, row in df.head(process_data.HEADER_SCAN_ROWS).iterrows():
+        row_str = row.astype(str).str.lower().tolist()
+        has_code = any("код" in s for s in row_str)
+        has_tn = any("тн" in s and "вэд" in s for s in row_str)
+        has_name = any("наименование" in s for s in row_str)
+        if (has_code and has_tn) or (has_code and has_name):
+            header_row_idx, code_col_idx = idx, next((c for c, v in enumerate(row_str) if "код" in v), -1)
+            break
+    if header_row_idx is None:
+        return None, None, None
+    
+    candidates = []
+    for c in range(df.shape[1]):
+        col_text = ""
+        for r in [header_row_idx, header_row_idx + 1, header_row_idx + 2]:
+            if r < len(df):
+                val = str(df.iloc[r, c]).lower()
+                if val != 'nan':
+                    col_text += " " + val
+        has_thous = "тыс" in col_text
+        has_ton = "тонн" in col_text or " т." in col_text or " т " in col_text or re.search(r'\d\s*т$', col_text)
+        has_bad = any(x in col_text for x in ["долл", "usd", "руб", "стоим", "цена", "%", "темп", "рост", "млн"])
+        if has_thous and has_ton and not has_bad:
+            candidates.append(c)
+    return header_row_idx, code_col_idx, candidates[-1] if candidates else None
+
+
+def bench_layout_detection(years=2, n_rows=200, repeat=3):
+    root = tempfile.mkdtemp(prefix='metal_layout_')
+    try:
+        build_synthetic_archive(root, range(2024 - years, 2024), n_rows)
+        files = [f for flow in FLOW_TITLES
+                 for f in process_data.list_customs_files(os.path.join(root, process_data.BASE_DIR, flow))]
+        heads = [process_data.read_excel_head(f)[0] for f in files]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    
+    legacy_time = best_time(lambda: [legacy_detect_layout(df) for df in heads], repeat)
+    cold_time = best_time(lambda: [process_data.detect_layout(df, {}) for df in heads], repeat)
+    
+    layouts = {}
+    for df in heads:
+        process_data.detect_layout(df, layouts)
+    stats = []
+    def detect_warm():
+        stats.clear()
+        for df in heads:
+            stats.append({})
+            process_data.detect_layout(df, layouts, stats[-1])
+    warm_time = best_time(detect_warm, repeat)
+    
+    hits = sum(1 for st in stats if st['layout'] == 'hit')
+    print(f"Поиск заголовков: файлов {len(heads)}, шаблонов {len(layouts)}, попаданий в кэш {hits} ({hits / len(heads):.0%})")
+    print(f"  iterrows: {legacy_time * 1000:.1f} мс, полный поиск: {cold_time * 1000:.1f} мс, "
+          f"с кэшем шаблонов: {warm_time * 1000:.1f} мс")
+    return {'files': len(heads), 'hits': hits, 'legacy_seconds': legacy_time, 'cold_seconds': cold_time,
+            'seconds': warm_time}
+
+
+def run_main_measured(root, stream, use_cache=False):
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, elapsed, peak = measure(lambda: process_data.main(workers=1, use_cache=use_cache, stream=stream))
+        df = pd.read_excel(process_data.OUTPUT_FILE)
+    finally:
+        os.chdir(cwd)
+    return df, elapsed, peak
+
+
+def bench_streaming_memory(years=10, small_years=2, n_rows=200):
+    results = {}
+    for n_years in (small_years, years):
+        root = tempfile.mkdtemp(prefix='metal_stream_')
+        try:
+            build_synthetic_archive(root, range(2025 - n_years, 2025), n_rows)
+            _, lists_time, lists_peak = run_main_measured(root, stream=False)
+            _, stream_time, stream_peak = run_main_measured(root, stream=True)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+        print(f"Лет {n_years}, файлов {n_years * 24}, строк в файле {n_rows}:")
+        print(f"  списки записей: {lists_time:.2f} с, пик {lists_peak / 2**20:.1f} МБ")
+        print(f"  потоковый режим: {stream_time:.2f} с, пик {stream_peak / 2**20:.1f} МБ")
+        results[n_years] = {'lists_seconds': lists_time, 'seconds': stream_time,
+                            'lists_peak': lists_peak, 'peak': stream_peak}
+    
+    growth = results[years]['peak'] / results[small_years]['peak']
+    lists_growth = results[years]['lists_peak'] / results[small_years]['lists_peak']
+    print(f"Рост пика памяти с {small_years} до {years} лет: списки x{lists_growth:.2f}, потоковый x{growth:.2f}")
+    return {'years': results, 'growth': growth, 'lists_growth': lists_growth}
+
+
+def synthetic_demand_panel(n_products=8, n_periods=96, horizon=12, gap_share=0.15, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_periods + horizon)
+    n_series = len(forecast.FLOWS) * n_products
+    base = rng.uniform(100, 10000, (n_series, 1))
+    trend = rng.uniform(-0.003, 0.006, (n_series, 1)) * base * t
+    season = rng.uniform(0.05, 0.3, (n_series, 1)) * base * np.sin(2 * np.pi * (t + rng.integers(0, 12, (n_series, 1))) / 12)
+    truth = np.maximum(base + trend + season + rng.normal(0, 0.03, (n_series, len(t))) * base, 0)
+    
+    observed = truth[:, :n_periods].copy()
+    observed[rng.random(observed.shape) < gap_share] = np.nan
+    return observed.reshape(len(forecast.FLOWS), n_products, n_periods), truth
+
+
+def bench_forecast(sizes=(8, 100, 500), n_periods=96, horizon=12, repeat=3):
+    first_period = 2017 * 12
+    results = {}
+    for n_products in sizes:
+        panel, truth = synthetic_demand_panel(n_products, n_periods, horizon)
+        seconds = best_time(lambda: forecast.forecast_panel(panel, first_period, horizon), repeat)
+        values, _ = forecast.forecast_panel(panel, first_period, horizon)
+        values = values.reshape(len(truth), -1)
+        
+        series = panel.reshape(len(truth), -1)
+        gaps = np.isnan(series)
+        fill_error = np.abs(values[:, :n_periods] - truth[:, :n_periods])[gaps].mean()
+        linear_error = np.abs(forecast.interpolate(series) - truth[:, :n_periods])[gaps].mean()
+        
+        future = truth[:, n_periods:]
+        hw_error = np.abs(values[:, n_periods:] - future).mean()
+        naive = forecast.interpolate(series)[:, n_periods - 12:][:, np.arange(horizon) % 12]
+        naive_error = np.abs(naive - future).mean()
+        
+        print(f"Товаров {n_products}, рядов {len(truth)}, месяцев {n_periods}: {seconds * 1000:.1f} мс "
+              f"({seconds / len(truth) * 1e6:.0f} мкс на ряд)")
+        print(f"  пропуски: сезонное восполнение MAE {fill_error:.1f}, линейное {linear_error:.1f}; "
+              f"прогноз на {horizon} мес.: Holt-Winters MAE {hw_error:.1f}, сезонный наивный {naive_error:.1f}")
+        results[n_products] = {'seconds': seconds, 'series': len(truth), 'fill_mae': fill_error,
+                               'linear_mae': linear_error, 'forecast_mae': hw_error, 'naive_mae': naive_error}
+    return results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    subparsers = arg_parser.add_subparsers(dest='bench', required=True)
+    
+    sniff_parser = subparsers.add_parser('sniff', help='перебор движков против определения формата')
+    sniff_parser.add_argument('folders', nargs='*',
+                              default=[os.path.join(process_data.BASE_DIR, 'import'), os.path.join(process_data.BASE_DIR, 'export')])
+    
+    regional_parser = subparsers.add_parser('regional', help='региональное распределение спроса')
+    regional_parser.add_argument('--scale', type=int, default=10)
+    
+    electricity_parser = subparsers.add_parser('electricity', help='доли регионов в электропотреблении')
+    electricity_parser.add_argument('--rows', type=int, default=5000)
+    
+    thousands_parser = subparsers.add_parser('thousands', help='перевод производства в тысячи')
+    thousands_parser.add_argument('--file', help='Proizvodstvo_mes_2017-2024.xlsx, иначе синтетический лист')
+    thousands_parser.add_argument('--rows', type=int, default=400)
+    
+    merge_parser = subparsers.add_parser('merge', help='сведение производства, импорта и экспорта')
+    merge_parser.add_argument('--products', type=int, default=1000)
+    merge_parser.add_argument('--years', type=int, default=30)
+    
+    mapping_parser = subparsers.add_parser('mapping', help='поиск кодов ТН ВЭД в справочнике')
+    mapping_parser.add_argument('--entries', type=int, default=10000)
+    mapping_parser.add_argument('--codes', type=int, default=50000)
+    
+    crawl_parser = subparsers.add_parser('crawl', help='обход страниц списка файлов на локальном сайте')
+    crawl_parser.add_argument('--pages', type=int, default=300)
+    crawl_parser.add_argument('--per-page', type=int, default=20)
+    crawl_parser.add_argument('--workers', type=int, default=8)
+    
+    service_parser = subparsers.add_parser('service', help='нагрузочный тест локального сервиса запросов')
+    service_parser.add_argument('--requests', type=int, default=2000)
+    service_parser.add_argument('--clients', type=int, default=8)
+    service_parser.add_argument('--regions', type=int, default=85)
+    service_parser.add_argument('--products', type=int, default=8)
+    
+    startup_parser = subparsers.add_parser('startup', help='время холодного старта cli.py и импорта process_data')
+    startup_parser.add_argument('--root', default='.', help='папка с data/ для cli.py check')
+    startup_parser.add_argument('--repeat', type=int, default=5)
+    
+    forecast_parser = subparsers.add_parser('forecast', help='восполнение пропусков и прогноз спроса по панели товаров')
+    forecast_parser.add_argument('--sizes', type=int, nargs='+', default=[8, 100, 500])
+    forecast_parser.add_argument('--months', type=int, default=96)
+    
+    stream_parser = subparsers.add_parser('stream', help='пик памяти main со списками записей и в потоковом режиме')
+    stream_parser.add_argument('--years', type=int, default=10)
+    stream_parser.add_argument('--small-years', type=int, default=2)
+    stream_parser.add_argument('--rows', type=int, default=200)
+    
+    layout_parser = subparsers.add_parser('layout', help='поиск строки заголовка и колонок с кэшем шаблонов')
+    layout_parser.add_argument('--years', type=int, default=2)
+    layout_parser.add_argument('--rows', type=int, default=200)
+    
+    suite_parser = subparsers.add_parser('suite', help='синтетический архив и замер всех этапов с проверкой регрессий')
+    suite_parser.add_argument('--root', help='папка для синтетического архива (по умолчанию временная)')
+    suite_parser.add_argument('--years', type=int, default=1)
+    suite_parser.add_argument('--rows', type=int, default=500, help='строк в таможенном файле')
+    suite_parser.add_argument('--xls-share', type=float, default=0.5, help='доля файлов в формате xls')
+    suite_parser.add_argument('--repeat', type=int, default=3)
+    suite_parser.add_argument('--results', default=BENCH_RESULTS, help='история замеров (JSON Lines)')
+    suite_parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                              help='допустимое замедление относительно прошлого запуска')
+    
+    args = arg_parser.parse_args()
+
+    if args.bench == 'sniff':
+        files = []
+        for folder in args.folders:
+            files.extend(process_data.list_customs_files(folder))
+        if not files:
+            print("Файлы не найдены.")
+            sys.exit(1)
+        bench_format_sniffing(files)
+    elif args.bench == 'regional':
+        bench_regional_allocation(args.scale)
+    elif args.bench == 'electricity':
+        bench_electricity_shares(args.rows)
+    elif args.bench == 'thousands':
+        bench_scale_thousands(args.file, args.rows)
+    elif args.bench == 'merge':
+        bench_final_merge(args.products, args.years)
+    elif args.bench == 'mapping':
+        bench_mapping_lookup(args.entries, args.codes)
+    elif args.bench == 'suite':
+        result = bench_suite(args.root, args.years, args.rows, args.xls_share, args.repeat, args.results, args.tolerance)
+        if result['regressions']:
+            sys.exit(1)
+    elif args.bench == 'crawl':
+        bench_listing_crawl(args.pages, args.per_page, args.workers)
+    elif args.bench == 'service':
+        bench_query_service(args.requests, args.clients, args.regions, args.products)
+    elif args.bench == 'layout':
+        bench_layout_detection(args.years, args.rows)
+    elif args.bench == 'stream':
+        bench_streaming_memory(args.years, args.small_years, args.rows)
+    elif args.bench == 'forecast':
+        bench_forecast(args.sizes, args.months)
+    elif args.bench == 'startup':
+        for name, seconds in cold_start_times(args.root, args.repeat).items():
+            print(f"{name}: {seconds * 1000:.0f} мс")
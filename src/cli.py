@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import argparse
+import importlib
+
+import inventory
+import mapping
+
+COMMANDS = {
+    'download': ('parser', 'загрузка таможенных файлов и таблиц Росстата'),
+    'process': ('process_data', 'разбор таможенных файлов и сведение таблицы спроса'),
+    'regional': ('regional', 'распределение спроса по регионам'),
+    'forecast': ('forecast', 'восполнение пропусков и прогноз спроса'),
+    'pipeline': ('pipeline', 'весь конвейер с пропуском актуальных этапов'),
+    'serve': ('service', 'локальный сервис запросов к агрегатам'),
+}
+FLOW_NAMES = {'import': 'Импорт', 'export': 'Экспорт'}
+
+
+def format_periods(periods):
+    ranges = []
+    for year, month in periods:
+        index = year * 12 + month - 1
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+
+    def label(i):
+        return f"{i // 12}-{i % 12 + 1:02d}"
+    return ", ".join(label(a) if a == b else f"{label(a)}..{label(b)}" for a, b in ranges)
+
+
+def run_check(args):
+    report = inventory.check_inventory((args.years[0], args.years[1]))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=1))
+    else:
+        n_months = (args.years[1] - args.years[0] + 1) * 12
+        for flow, title in FLOW_NAMES.items():
+            flow_report = report[flow]
+            print(f"{title}: есть {len(flow_report['present'])} из {n_months} месяцев, нет {len(flow_report['missing'])}")
+            if flow_report['missing']:
+                print(f"  нет: {format_periods(flow_report['missing'])}")
+            if flow_report['outside']:
+                print(f"  вне периода: {format_periods(flow_report['outside'])}")
+            for period, files in flow_report['duplicates'].items():
+                print(f"  несколько файлов за {period}: {', '.join(os.path.basename(f) for f in files)}")
+            if flow_report['unknown']:
+                print(f"  период не известен (файл ещё не разобран): {len(flow_report['unknown'])}")
+        production = report['production']['files']
+        print(f"Производство: {', '.join(production) if production else 'файл не найден'}")
+
+    complete = all(not report[flow]['missing'] and not report[flow]['unknown'] for flow in FLOW_NAMES)
+    return 0 if complete and report['production']['files'] else 1
+
+
+def folder_size(path):
+    total, count = 0, 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+            count += 1
+    return count, total
+
+
+def run_cache(args):
+    if not os.path.isdir(inventory.CACHE_DIR):
+        print(f"Кэш пуст: нет папки {inventory.CACHE_DIR}")
+        return 0
+
+    groups = {}
+    for name in sorted(os.listdir(inventory.CACHE_DIR)):
+        path = os.path.join(inventory.CACHE_DIR, name)
+        if os.path.isdir(path):
+            count, size = folder_size(path)
+            key = name + '/'
+        else:
+            count, size = 1, os.path.getsize(path)
+            key = name.split('_', 1)[0] + '_*.npz' if name.endswith('.npz') else name
+        group = groups.setdefault(key, [0, 0])
+        group[0] += count
+        group[1] += size
+
+    for key, (count, size) in groups.items():
+        print(f"{key}: файлов {count}, {size / 2**20:.2f} МБ")
+    print(f"Всего: {sum(g[1] for g in groups.values()) / 2**20:.2f} МБ в {inventory.CACHE_DIR}")
+    return 0
+
+
+def run_mapping(args):
+    path = args.path or mapping.MAPPING_FILE
+    if not os.path.exists(path):
+        print(f"Нет справочника {path}")
+        return 1
+    entries = mapping.load_mapping(path)
+    if not entries:
+        print(f"Справочник {path} пуст")
+        return 1
+
+    invalid = [(product, code) for product, code in entries if mapping.parse_rule(code)[1] is None]
+    repeated = len(entries) - len(set(entries))
+    registry = mapping.compile_registry(entries)
+    print(f"Справочник {path}: правил {len(entries)}, товаров {len(registry['products'])}, "
+          f"повторов {repeated}, отпечаток {registry['fingerprint'][:8]}")
+    for product, code in invalid:
+        print(f"  не распознано: {product}: {code}")
+    return 1 if invalid else 0
+
+
+def run_module(name, argv):
+    module = importlib.import_module(name)
+    module.run_cli(argv)
+    return 0
+
+
+def build_parser():
+    arg_parser = argparse.ArgumentParser(description='MetalDemand Analytics')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    check_parser = subparsers.add_parser('check', help='какие месяцы импорта и экспорта есть, а каких нет')
+    check_parser.add_argument('--years', type=int, nargs=2, default=list(inventory.CHECK_YEARS), metavar=('FROM', 'TO'))
+    check_parser.add_argument('--json', action='store_true', help='вывести отчёт в JSON')
+    subparsers.add_parser('cache', help='что лежит в кэше и сколько места занимает')
+    mapping_parser = subparsers.add_parser('mapping', help='проверить справочник кодов ТН ВЭД')
+    mapping_parser.add_argument('path', nargs='?', help='путь к справочнику (по умолчанию data/bridge_map.csv)')
+
+    for command, (_, help_text) in COMMANDS.items():
+        subparsers.add_parser(command, help=help_text, add_help=False)
+    return arg_parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args, rest = build_parser().parse_known_args(argv)
+    if args.command in COMMANDS:
+        return run_module(COMMANDS[args.command][0], rest)
+    if rest:
+        build_parser().error(f"неизвестные аргументы: {' '.join(rest)}")
+    return {'check': run_check, 'cache': run_cache, 'mapping': run_mapping}[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
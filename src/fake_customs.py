@@ -0,0 +1,91 @@
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+FILE_PREFIX = '/document_statistics_file/'
+LISTINGS = {'/statistic/eksport-rossii-vazhnejshix-tovarov': 'export', '/folder/515': 'import'}
+XLSX_BODY = b'PK\x03\x04' + b'x' * 20000
+XLS_BODY = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1' + b'x' * 20000
+HTML_BODY = b'<!doctype html><html><body>error</body></html>' * 50
+
+
+def listing_page(path, page, n_pages, per_page, overlap):
+    kind = LISTINGS.get(path, path.strip('/').replace('/', '_'))
+    page = min(page, n_pages)
+    first = max(0, (page - 1) * per_page - overlap)
+    links = ''.join(f'<li><a href="{FILE_PREFIX}{kind}_{i}.xlsx">Файл {i}</a> '
+                    f'<a href="{FILE_PREFIX}{kind}_{i}.xlsx">скачать</a></li>'
+                    for i in range(first, page * per_page))
+    return (f'<html><body><a href="/news">Новости</a><ul>{links}</ul>'
+            f'<a href="{path}?page={page + 1}">Далее</a></body></html>').encode('utf-8')
+
+
+def file_body(name):
+    if name.startswith('html'):
+        return HTML_BODY, 'text/html'
+    if name.endswith('.xls'):
+        return XLS_BODY, 'application/vnd.ms-excel'
+    return XLSX_BODY + name.encode('utf-8'), 'application/octet-stream'
+
+
+def serve_fake_customs(n_pages=3, per_page=5, overlap=0, failures=None, host='127.0.0.1', port=0):
+    state = {'hits': {}, 'failures': dict(failures or {}), 'lock': threading.Lock()}
+
+    class FakeCustomsHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, code, body, content_type='text/html; charset=utf-8', headers=None):
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            with state['lock']:
+                state['hits'][self.path] = state['hits'].get(self.path, 0) + 1
+                failing = state['failures'].get(self.path, 0)
+                if failing:
+                    state['failures'][self.path] = failing - 1
+            if failing:
+                return self.send(503, b'busy')
+
+            if url.path.startswith(FILE_PREFIX):
+                name = url.path[len(FILE_PREFIX):]
+                etag = f'"{name}"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self.send(304, b'', headers={'ETag': etag})
+                body, content_type = file_body(name)
+                return self.send(200, body, content_type,
+                                 {'ETag': etag, 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+
+            if url.path in LISTINGS or 'page' in parse_qs(url.query):
+                page = int(parse_qs(url.query).get('page', ['1'])[0])
+                return self.send(200, listing_page(url.path, page, n_pages, per_page, overlap))
+            return self.send(200, b'<html><body>home</body></html>')
+
+    server = ThreadingHTTPServer((host, port), FakeCustomsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}", state
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--port', type=int, default=8765)
+    arg_parser.add_argument('--pages', type=int, default=3, help='страниц в каждом списке файлов')
+    arg_parser.add_argument('--per-page', type=int, default=5)
+    arg_parser.add_argument('--overlap', type=int, default=0, help='сколько ссылок повторяется с прошлой страницы')
+    args = arg_parser.parse_args()
+    server, base_url, _ = serve_fake_customs(args.pages, args.per_page, args.overlap, port=args.port)
+    print(f"Тестовый сайт ФТС: {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,193 @@
+import os
+import time
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import outputs
+import regional
+
+FORECAST_BASE = os.path.join('data', 'processed', 'demand_forecast')
+FLOWS = ['Production', 'Import', 'Export']
+ZERO_WHEN_REPORTED = ['Import', 'Export']
+SEASON = 12
+HORIZON = 12
+ALPHAS = [0.1, 0.3, 0.5, 0.7]
+BETAS = [0.0, 0.05, 0.15]
+GAMMAS = [0.05, 0.2, 0.4]
+
+STATUS_ACTUAL = 'факт'
+STATUS_FILLED = 'восстановлено'
+STATUS_FORECAST = 'прогноз'
+
+FORECAST_DTYPES = dict(outputs.DEMAND_DTYPES, Status='category')
+
+
+def demand_panel(df):
+    products = sorted(df['Product'].astype(str).unique())
+    period = df['Year'].to_numpy(dtype=np.int64) * SEASON + df['Month'].to_numpy(dtype=np.int64) - 1
+    first_period = int(period.min())
+    n_periods = int(period.max()) - first_period + 1
+    product_pos = pd.Categorical(df['Product'].astype(str), categories=products).codes
+
+    panel = np.full((len(FLOWS), len(products), n_periods), np.nan)
+    for i, flow in enumerate(FLOWS):
+        panel[i, product_pos, period - first_period] = df[flow].to_numpy(dtype=np.float64)
+        if flow in ZERO_WHEN_REPORTED:
+            reported = ~np.isnan(panel[i]).all(axis=0)
+            panel[i][:, reported] = np.nan_to_num(panel[i][:, reported])
+    return products, first_period, panel
+
+
+def group_mean(series, groups, n_groups):
+    onehot = np.zeros((series.shape[1], n_groups))
+    onehot[np.arange(series.shape[1]), groups] = 1
+    observed = ~np.isnan(series)
+    sums = np.nan_to_num(series) @ onehot
+    counts = observed @ onehot
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def seasonal_profile(series, first_period):
+    periods = first_period + np.arange(series.shape[1])
+    months = periods % SEASON
+    years = periods // SEASON - periods[0] // SEASON
+
+    year_mean = group_mean(series, years, years[-1] + 1)
+    profile = np.nan_to_num(group_mean(series - year_mean[:, years], months, SEASON))
+    profile -= profile.mean(axis=1, keepdims=True)
+    return profile[:, months]
+
+
+def interpolate(series):
+    n, n_periods = series.shape
+    idx = np.arange(n_periods)
+    rows = np.arange(n)[:, None]
+    observed = ~np.isnan(series)
+
+    prev_idx = np.maximum.accumulate(np.where(observed, idx, -1), axis=1)
+    next_idx = np.minimum.accumulate(np.where(observed, idx, n_periods)[:, ::-1], axis=1)[:, ::-1]
+    has_prev, has_next = prev_idx >= 0, next_idx < n_periods
+    prev_val = series[rows, np.clip(prev_idx, 0, n_periods - 1)]
+    next_val = series[rows, np.clip(next_idx, 0, n_periods - 1)]
+
+    weight = (idx - prev_idx) / np.maximum(next_idx - prev_idx, 1)
+    inner = prev_val + weight * (next_val - prev_val)
+    filled = np.where(has_prev & has_next, inner, np.where(has_prev, prev_val, next_val))
+    return np.where(observed, series, filled)
+
+
+def fill_gaps(series, first_period):
+    seasonal = seasonal_profile(series, first_period)
+    filled = interpolate(series - seasonal) + seasonal
+    missing = np.isnan(series)
+    filled = np.where(missing, np.maximum(filled, 0), series)
+    return filled, missing & ~np.isnan(filled)
+
+
+def holt_winters(series, alpha, beta, gamma):
+    n_periods = series.shape[1]
+    level = series[:, :SEASON].mean(axis=1)
+    trend = (series[:, SEASON:2 * SEASON].mean(axis=1) - level) / SEASON
+    seasonal = series[:, :SEASON] - level[:, None]
+    sse = np.zeros(len(series))
+
+    for t in range(n_periods):
+        s = t % SEASON
+        y = series[:, t]
+        if t >= SEASON:
+            sse += (y - level - trend - seasonal[:, s]) ** 2
+        prev_level = level
+        level = alpha * (y - seasonal[:, s]) + (1 - alpha) * (level + trend)
+        trend = beta * (level - prev_level) + (1 - beta) * trend
+        seasonal[:, s] = gamma * (y - level) + (1 - gamma) * seasonal[:, s]
+    return level, trend, seasonal, sse
+
+
+def fit_forecast(series, horizon=HORIZON):
+    n, n_periods = series.shape
+    grid = np.array(list(itertools.product(ALPHAS, BETAS, GAMMAS)))
+    params = np.tile(grid, (n, 1))
+    _, _, _, sse = holt_winters(np.repeat(series, len(grid), axis=0), params[:, 0], params[:, 1], params[:, 2])
+    best = grid[sse.reshape(n, len(grid)).argmin(axis=1)]
+
+    level, trend, seasonal, _ = holt_winters(series, best[:, 0], best[:, 1], best[:, 2])
+    steps = np.arange(1, horizon + 1)
+    forecast = level[:, None] + steps * trend[:, None] + seasonal[:, (n_periods + steps - 1) % SEASON]
+    return np.maximum(forecast, 0), best
+
+
+def forecast_panel(panel, first_period, horizon=HORIZON):
+    n_flows, n_products, n_periods = panel.shape
+    series = panel.reshape(-1, n_periods)
+    filled, was_filled = fill_gaps(series, first_period)
+
+    forecast = np.full((len(series), horizon), np.nan)
+    usable = ~np.isnan(filled).any(axis=1)
+    if n_periods >= 2 * SEASON and horizon > 0 and usable.any():
+        forecast[usable], _ = fit_forecast(filled[usable], horizon)
+    elif horizon > 0:
+        print(f"Прогноз пропущен: нужно не меньше {2 * SEASON} месяцев данных")
+
+    values = np.concatenate([filled, forecast], axis=1).reshape(n_flows, n_products, n_periods + horizon)
+    was_filled = was_filled.reshape(n_flows, n_products, n_periods).any(axis=0)
+    return values, was_filled
+
+
+def build_forecast_table(df_demand, horizon=HORIZON):
+    products, first_period, panel = demand_panel(df_demand)
+    values, was_filled = forecast_panel(panel, first_period, horizon)
+    n_products, n_total = values.shape[1], values.shape[2]
+    n_periods = n_total - horizon
+
+    status = np.full((n_products, n_total), STATUS_ACTUAL, dtype=object)
+    status[:, :n_periods][was_filled] = STATUS_FILLED
+    status[:, n_periods:] = STATUS_FORECAST
+
+    periods = first_period + np.arange(n_total)
+    df_out = pd.DataFrame({
+        'Year': np.tile(periods // SEASON, n_products),
+        'Month': np.tile(periods % SEASON + 1, n_products),
+        'Product': np.repeat(products, n_total),
+    })
+    for i, flow in enumerate(FLOWS):
+        df_out[flow] = values[i].ravel()
+    df_out['Demand'] = df_out['Production'] + df_out['Import'] - df_out['Export']
+    df_out['Status'] = status.ravel()
+    return df_out
+
+
+def main(demand_path=None, horizon=HORIZON, formats=('xlsx',)):
+    demand_path = demand_path or outputs.find_existing_output(regional.DEMAND_BASE)
+    if not demand_path or not os.path.exists(demand_path):
+        print(f"Не найдена таблица спроса {regional.DEMAND_BASE}")
+        return None
+
+    df_demand = outputs.read_table(demand_path, dtypes=outputs.DEMAND_DTYPES)
+    started = time.perf_counter()
+    df_out = build_forecast_table(df_demand, horizon)
+    elapsed = time.perf_counter() - started
+
+    os.makedirs(os.path.dirname(FORECAST_BASE), exist_ok=True)
+    written = outputs.write_table(df_out, FORECAST_BASE, formats, FORECAST_DTYPES)
+    counts = df_out['Status'].value_counts()
+    print(f"Товаров {df_out['Product'].nunique()}, восстановлено месяцев {counts.get(STATUS_FILLED, 0)}, "
+          f"прогноз на {horizon} мес. ({elapsed:.3f} с). Результат: {', '.join(written)}")
+    return written
+
+
+def run_cli(argv=None):
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--demand', help='таблица спроса по России (по умолчанию результат process_data)')
+    arg_parser.add_argument('--horizon', type=int, default=HORIZON, help='на сколько месяцев вперёд прогнозировать')
+    arg_parser.add_argument('--format', nargs='+', choices=outputs.OUTPUT_FORMATS, default=['xlsx'],
+                            help='форматы прогноза')
+    args = arg_parser.parse_args(argv)
+    main(args.demand, max(0, args.horizon), args.format)
+
+
+if __name__ == "__main__":
+    run_cli()
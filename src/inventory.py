@@ -0,0 +1,113 @@
+import os
+import re
+import json
+
+BASE_DIR = 'data'
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+PERIODS_FILE = os.path.join(CACHE_DIR, 'periods.json')
+CUSTOMS_FLOWS = ['import', 'export']
+CUSTOMS_EXTENSIONS = ('.xls', '.xlsx')
+CHECK_YEARS = (2017, 2024)
+
+NUMERIC_PERIOD_RE = re.compile(r'(?<!\d)(20\d{2})[_\-.](0[1-9]|1[0-2])(?!\d)')
+WORD_PERIOD_RE = re.compile(r'(январ|феврал|март|апрел|ма[йя]|июн|июл|август|сентябр|октябр|ноябр|декабр)\w*[_\-. ]*(20\d{2})')
+MONTH_STEMS = ['январ', 'феврал', 'март', 'апрел', 'ма', 'июн', 'июл', 'август', 'сентябр', 'октябр', 'ноябр', 'декабр']
+
+
+def load_period_index(path=PERIODS_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Не читается индекс периодов {path}: {e}")
+        return {}
+
+
+def save_period_index(index, path=PERIODS_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def update_period_index(flow_periods, path=PERIODS_FILE):
+    index = load_period_index(path)
+    for flow, periods in flow_periods.items():
+        for filepath, period in periods.items():
+            if not os.path.exists(filepath):
+                continue
+            entry = index.get(filepath)
+            stamp = file_stamp(filepath)
+            if period is None and entry and entry['stamp'] == stamp:
+                period = entry['period']
+            if period is None:
+                index.pop(filepath, None)
+            else:
+                index[filepath] = {'flow': flow, 'stamp': stamp, 'period': [int(period[0]), int(period[1])]}
+
+    for filepath in [f for f in index if not os.path.exists(f)]:
+        del index[filepath]
+    save_period_index(index, path)
+    return index
+
+
+def period_from_name(filepath):
+    name = os.path.basename(filepath).lower()
+    match = NUMERIC_PERIOD_RE.search(name)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    match = WORD_PERIOD_RE.search(name)
+    if match:
+        stem = next(s for s in MONTH_STEMS if match.group(1).startswith(s))
+        return int(match.group(2)), MONTH_STEMS.index(stem) + 1
+    return None
+
+
+def list_customs_files(folder):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(CUSTOMS_EXTENSIONS))
+
+
+def file_period(filepath, index):
+    entry = index.get(filepath)
+    if entry and entry['stamp'] == file_stamp(filepath):
+        return tuple(entry['period'])
+    return period_from_name(filepath)
+
+
+def check_inventory(years=CHECK_YEARS, base_dir=BASE_DIR, index=None):
+    index = load_period_index() if index is None else index
+    expected = [(y, m) for y in range(years[0], years[1] + 1) for m in range(1, 13)]
+    expected_set = set(expected)
+    report = {}
+
+    for flow in CUSTOMS_FLOWS:
+        found = {}
+        unknown = []
+        for filepath in list_customs_files(os.path.join(base_dir, flow)):
+            period = file_period(filepath, index)
+            if period is None:
+                unknown.append(filepath)
+            else:
+                found.setdefault(period, []).append(filepath)
+        report[flow] = {
+            'present': [p for p in expected if p in found],
+            'missing': [p for p in expected if p not in found],
+            'duplicates': {f"{y}-{m:02d}": files for (y, m), files in sorted(found.items()) if len(files) > 1},
+            'outside': sorted(p for p in found if p not in expected_set),
+            'unknown': unknown,
+        }
+
+    production_dir = os.path.join(base_dir, 'production')
+    production = sorted(f for f in os.listdir(production_dir) if f.endswith('.xlsx')) if os.path.isdir(production_dir) else []
+    report['production'] = {'files': production}
+    return report
@@ -0,0 +1,165 @@
+import os
+import csv
+import json
+import bisect
+import hashlib
+
+EXCLUDE_MARK = 'кроме'
+RANGE_SEP = '-'
+HEAD_WIDTH = 4
+MAPPING_COLUMNS = ['product', 'code']
+MAPPING_FILE = os.path.join('data', 'bridge_map.csv')
+
+
+def entries_from_dict(bridge_map):
+    return [(product, str(code).strip()) for product, codes in bridge_map.items() for code in codes]
+
+
+def load_mapping(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            print(f"Справочник {path} пропущен: не установлен PyYAML")
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return entries_from_dict(yaml.safe_load(f) or {})
+
+    entries = []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f, delimiter=';'):
+            product = (row.get('product') or '').strip()
+            code = (row.get('code') or '').strip()
+            if product and code:
+                entries.append((product, code))
+    return entries
+
+
+def save_mapping(entries, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(MAPPING_COLUMNS)
+        writer.writerows(entries)
+
+
+def parse_rule(code):
+    text = str(code).strip().lower()
+    exclude = text.startswith(EXCLUDE_MARK)
+    if exclude:
+        text = text[len(EXCLUDE_MARK):].strip()
+
+    if RANGE_SEP in text:
+        start, end = [t.strip() for t in text.split(RANGE_SEP, 1)]
+        if start.isdigit() and end.isdigit() and len(start) == len(end) and start <= end:
+            return exclude, start, end
+        return exclude, None, None
+
+    digits = "".join(filter(str.isdigit, text))
+    return exclude, digits or None, digits or None
+
+
+def _trie_insert(trie, prefix, p_idx, exclude):
+    node = trie
+    for digit in prefix:
+        node = node['next'].setdefault(digit, {'next': {}, 'include': set(), 'exclude': set()})
+    node['exclude' if exclude else 'include'].add(p_idx)
+
+
+def _build_intervals(intervals):
+    events = {}
+    for lo, hi, p_idx, exclude in intervals:
+        events.setdefault(lo, []).append((p_idx, exclude, 1))
+        events.setdefault(hi + 1, []).append((p_idx, exclude, -1))
+
+    bounds = sorted(events)
+    segments = []
+    active = {}
+    for bound in bounds:
+        for p_idx, exclude, step in events[bound]:
+            active[(p_idx, exclude)] = active.get((p_idx, exclude), 0) + step
+            if active[(p_idx, exclude)] == 0:
+                del active[(p_idx, exclude)]
+        segments.append((frozenset(p for p, ex in active if not ex), frozenset(p for p, ex in active if ex)))
+    return bounds, segments
+
+
+def compile_registry(entries):
+    products = []
+    product_idx = {}
+    trie = {'next': {}, 'include': set(), 'exclude': set()}
+    intervals = {}
+    heads = {}
+    skipped = []
+
+    for product, code in entries:
+        if product not in product_idx:
+            product_idx[product] = len(products)
+            products.append(product)
+        p_idx = product_idx[product]
+
+        exclude, start, end = parse_rule(code)
+        if start is None:
+            skipped.append((product, code))
+            continue
+
+        if start == end:
+            _trie_insert(trie, start, p_idx, exclude)
+        else:
+            intervals.setdefault(len(start), []).append((int(start), int(end), p_idx, exclude))
+
+        if not exclude and len(start) >= HEAD_WIDTH:
+            for head in range(int(start[:HEAD_WIDTH]), int(end[:HEAD_WIDTH]) + 1):
+                heads.setdefault(head, set()).add(p_idx)
+
+    if skipped:
+        print(f"Справочник: пропущено нераспознанных кодов {len(skipped)}")
+
+    head_keys = sorted(heads)
+    return {
+        'products': products,
+        'trie': trie,
+        'intervals': {width: _build_intervals(items) for width, items in intervals.items()},
+        'heads': head_keys,
+        'head_products': [heads[h] for h in head_keys],
+        'fingerprint': hashlib.md5(json.dumps(entries, ensure_ascii=False).encode('utf-8')).hexdigest(),
+    }
+
+
+def lookup_code(registry, digits):
+    rules = [None] * (len(digits) + 1)
+
+    node = registry['trie']
+    for depth, digit in enumerate(digits, 1):
+        node = node['next'].get(digit)
+        if node is None:
+            break
+        if node['include'] or node['exclude']:
+            rules[depth] = [(node['include'], node['exclude'])]
+
+    for width, (bounds, segments) in registry['intervals'].items():
+        if width > len(digits):
+            continue
+        pos = bisect.bisect_right(bounds, int(digits[:width])) - 1
+        if pos >= 0 and (segments[pos][0] or segments[pos][1]):
+            rules[width] = (rules[width] or []) + [segments[pos]]
+
+    decided = {}
+    for depth in range(len(digits), 0, -1):
+        for include, exclude in rules[depth] or ():
+            for p_idx in exclude:
+                decided.setdefault(p_idx, False)
+        for include, exclude in rules[depth] or ():
+            for p_idx in include:
+                decided.setdefault(p_idx, True)
+
+    return tuple(registry['products'][p_idx] for p_idx in sorted(p for p, ok in decided.items() if ok))
+
+
+def lookup_range(registry, start_head, end_head):
+    lo = bisect.bisect_left(registry['heads'], start_head)
+    hi = bisect.bisect_right(registry['heads'], end_head)
+    found = set()
+    for products in registry['head_products'][lo:hi]:
+        found.update(products)
+    return tuple(registry['products'][p_idx] for p_idx in sorted(found))
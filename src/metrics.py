@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import contextlib
+import contextvars
+
+ENABLED = False
+LOG_PATH = None
+PROFILE_DIR = None
+PROFILE_PID = None
+LOCK = threading.Lock()
+
+PROFILES = {}
+PROFILING = [False]
+
+
+class Collector:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.counters = {}
+
+    def add_timing(self, name, calls, seconds):
+        with self.lock:
+            timing = self.timings.setdefault(name, [0, 0.0])
+            timing[0] += calls
+            timing[1] += seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, state):
+        for name, (calls, seconds) in state['timings'].items():
+            self.add_timing(name, calls, seconds)
+        for name, value in state['counters'].items():
+            self.count(name, value)
+
+    def state(self):
+        with self.lock:
+            return {'timings': {name: list(t) for name, t in self.timings.items()}, 'counters': dict(self.counters)}
+
+
+ROOT = Collector()
+CURRENT = contextvars.ContextVar('metrics_collector', default=ROOT)
+
+
+def configure(log_path='-', profile_dir=None):
+    global ENABLED, LOG_PATH, PROFILE_DIR, PROFILE_PID
+    ENABLED = True
+    LOG_PATH = log_path
+    PROFILE_DIR = profile_dir
+    PROFILE_PID = os.getpid()
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def set_enabled(enabled):
+    global ENABLED
+    ENABLED = enabled
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.profile = None
+
+    def __enter__(self):
+        if (PROFILE_DIR and not PROFILING[0] and os.getpid() == PROFILE_PID
+                and threading.current_thread() is threading.main_thread()):
+            PROFILING[0] = True
+            self.profile = PROFILES.setdefault(self.name, cProfile.Profile())
+            self.profile.enable()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        if self.profile is not None:
+            self.profile.disable()
+            PROFILING[0] = False
+        CURRENT.get().add_timing(self.name, 1, elapsed)
+        return False
+
+
+def stage(name):
+    if not ENABLED:
+        return NULL_STAGE
+    return _Stage(name)
+
+
+def count(name, n=1):
+    if not ENABLED:
+        return
+    CURRENT.get().count(name, n)
+
+
+@contextlib.contextmanager
+def collect():
+    collector = Collector()
+    token = CURRENT.set(collector)
+    try:
+        yield collector
+    finally:
+        CURRENT.reset(token)
+
+
+def merge(state):
+    if not ENABLED or not state:
+        return
+    CURRENT.get().merge(state)
+
+
+def emit(event, **fields):
+    if not ENABLED:
+        return
+    line = json.dumps({'ts': round(time.time(), 3), 'event': event, **fields}, ensure_ascii=False, default=str)
+    with LOCK:
+        if LOG_PATH in (None, '-'):
+            print(line, file=sys.stderr)
+        else:
+            with open(LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def report(run):
+    if not ENABLED:
+        return None
+    state = CURRENT.get().state()
+    stages = {name: {'calls': calls, 'seconds': round(seconds, 4)} for name, (calls, seconds) in sorted(state['timings'].items())}
+    emit('summary', run=run, stages=stages, counters=dict(sorted(state['counters'].items())))
+
+    if PROFILE_DIR:
+        for name, profile in PROFILES.items():
+            profile.dump_stats(os.path.join(PROFILE_DIR, f"{run}_{name}.prof"))
+    return {'stages': stages, 'counters': state['counters']}
@@ -0,0 +1,116 @@
+import os
+import shutil
+import hashlib
+
+import pandas as pd
+
+OUTPUT_FORMATS = ('xlsx', 'parquet', 'feather')
+FORMAT_EXTENSIONS = {'xlsx': '.xlsx', 'parquet': '.parquet', 'feather': '.feather'}
+
+DEMAND_DTYPES = {
+    'Year': 'int16',
+    'Month': 'int8',
+    'Product': 'category',
+    'Production': 'float64',
+    'Import': 'float64',
+    'Export': 'float64',
+    'Demand': 'float64',
+}
+DEMAND_PARTITIONS = ['Year', 'ProductKey']
+
+
+def product_key(name):
+    return hashlib.md5(str(name).encode('utf-8')).hexdigest()[:8]
+
+
+DERIVED_PARTITIONS = {'ProductKey': ('Product', product_key)}
+
+
+def output_path(base_path, fmt):
+    return base_path + FORMAT_EXTENSIONS[fmt]
+
+
+def apply_dtypes(df, dtypes):
+    if not dtypes:
+        return df
+    df = df.copy()
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype.startswith('float'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+        elif dtype == 'category':
+            df[col] = df[col].astype(str).astype('category')
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def _write_parquet(df, path, partition_cols):
+    tmp_path = path + '.tmp'
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+
+    if partition_cols:
+        for col in partition_cols:
+            if col not in df.columns and col in DERIVED_PARTITIONS:
+                source_col, key_func = DERIVED_PARTITIONS[col]
+                df = df.assign(**{col: df[source_col].astype(str).map(key_func)})
+        df.to_parquet(tmp_path, index=False, partition_cols=partition_cols)
+    else:
+        df.to_parquet(tmp_path, index=False)
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    os.replace(tmp_path, path)
+
+
+def write_table(df, base_path, formats=('xlsx',), dtypes=None, partition_cols=None):
+    df = apply_dtypes(df, dtypes).reset_index(drop=True)
+    written = []
+
+    for fmt in formats:
+        path = output_path(base_path, fmt)
+        if fmt == 'xlsx':
+            df.to_excel(path, index=False)
+        elif fmt in ('parquet', 'feather'):
+            try:
+                import pyarrow
+            except ImportError:
+                print(f"Формат {fmt} пропущен: не установлен pyarrow")
+                continue
+            if fmt == 'parquet':
+                _write_parquet(df, path, partition_cols)
+            else:
+                df.to_feather(path, compression='uncompressed')
+        else:
+            print(f"Неизвестный формат вывода: {fmt}")
+            continue
+        written.append(path)
+
+    return written
+
+
+def read_table(path, columns=None, filters=None, dtypes=None):
+    if path.endswith('.feather'):
+        import pyarrow.feather as feather
+        df = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    elif path.endswith('.parquet'):
+        df = pd.read_parquet(path, columns=columns, filters=filters, memory_map=True)
+        df = df.drop(columns=[c for c in DERIVED_PARTITIONS if c in df.columns])
+    else:
+        df = pd.read_excel(path, usecols=columns)
+    
+    if dtypes:
+        ordered = [c for c in dtypes if c in df.columns]
+        df = df[ordered + [c for c in df.columns if c not in ordered]]
+    return apply_dtypes(df, dtypes)
+
+
+def find_existing_output(base_path, formats=OUTPUT_FORMATS):
+    for fmt in ('feather', 'parquet', 'xlsx'):
+        if fmt in formats and os.path.exists(output_path(base_path, fmt)):
+            return output_path(base_path, fmt)
+    return None
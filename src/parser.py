@@ -1,176 +1,426 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 import os
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import time
 import hashlib
+import threading
+import tempfile
+import itertools
+import json
+import asyncio
+import argparse
+from email.utils import formatdate
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
+import outputs
+import metrics
 
-def download_customs_data():
+
+CUSTOMS_HOST = 'https://customs.gov.ru'
+DATA_DIR = 'data'
+DOWNLOAD_WORKERS = 4
+REQUESTS_PER_SECOND = 2.0
+RETRY_TOTAL = 4
+RETRY_BACKOFF = 1.0
+
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Cache-Control': 'max-age=0',
+}
+
+DOWNLOAD_MANIFEST = 'download_manifest.json'
+MANIFEST_LOCK = threading.Lock()
+
+XLSX_MAGIC = b'PK'
+XLS_MAGIC = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1'
+CHUNK_SIZE = 64 * 1024
+EXCEL_LINK_PATTERNS = ['document_statistics_file', '.xlsx', '.xls']
+LISTING_MAX_PAGES = 1000
+
+
+class HostRateLimiter:
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url):
+        if self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                tokens, updated = self.buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                if tokens >= 1:
+                    self.buckets[host] = (tokens - 1, now)
+                    return
+                self.buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(headers, pool_size=DOWNLOAD_WORKERS):
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(headers)
+    return session
+
+
+def load_download_manifest(path=DOWNLOAD_MANIFEST):
+    manifest = {'files': {}}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest['files'] = json.load(f).get('files', {})
+        except Exception as e:
+            print(f"Не читается манифест загрузок {path}: {e}")
+    return manifest
+
+
+def save_download_manifest(manifest, path=DOWNLOAD_MANIFEST):
+    tmp_path = path + '.tmp'
+    with MANIFEST_LOCK:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+
+def conditional_headers(entry, local_path):
+    headers = {}
+    if not local_path or not os.path.exists(local_path):
+        return headers
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    else:
+        headers['If-Modified-Since'] = formatdate(os.path.getmtime(local_path), usegmt=True)
+    return headers
+
+
+def record_download(manifest, url, response, path, digest=None, size=None):
+    is_new_content = digest is not None
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        size = os.path.getsize(path)
+    
+    with MANIFEST_LOCK:
+        old = manifest['files'].get(url)
+        manifest['files'][url] = {
+            'etag': response.headers.get('ETag') or (old or {}).get('etag'),
+            'last_modified': response.headers.get('Last-Modified') or (old or {}).get('last_modified'),
+            'size': size,
+            'sha256': digest,
+            'path': path,
+        }
+    return is_new_content and (old is None or old.get('sha256') != digest or old.get('path') != path)
+
+
+def sniff_excel_format(head):
+    if head[:2] == XLSX_MAGIC:
+        return '.xlsx'
+    if head[:8] == XLS_MAGIC:
+        return '.xls'
+    return None
+
+
+def stream_to_temp(response, target_dir):
+    chunks = response.iter_content(CHUNK_SIZE)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= 8:
+            break
+    
+    result = {'kind': sniff_excel_format(head), 'head': head, 'tmp_path': None, 'sha256': None, 'size': 0}
+    if result['kind'] is None:
+        response.close()
+        return result
+    
+    h = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir or '.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in itertools.chain([head], chunks):
+                f.write(chunk)
+                h.update(chunk)
+                result['size'] += len(chunk)
+    except:
+        os.remove(tmp_path)
+        raise
+    
+    result['tmp_path'] = tmp_path
+    result['sha256'] = h.hexdigest()
+    metrics.count('bytes_downloaded', result['size'])
+    return result
+
+
+def fetch_with_manifest(session, url, path, manifest, headers=None, **kwargs):
+    entry = manifest['files'].get(url)
+    request_headers = dict(headers or {})
+    request_headers.update(conditional_headers(entry, path))
+    
+    with metrics.stage('download'):
+        response = session.get(url, headers=request_headers, stream=True, **kwargs)
+    try:
+        if response.status_code == 304 and os.path.exists(path):
+            metrics.count('not_modified')
+            record_download(manifest, url, response, path)
+            return False
+        
+        response.raise_for_status()
+        with metrics.stage('download'):
+            result = stream_to_temp(response, os.path.dirname(path))
+        if result['kind'] is None:
+            raise ValueError(f"{url} вернул не Excel файл")
+        os.replace(result['tmp_path'], path)
+    finally:
+        response.close()
+    
+    changed = record_download(manifest, url, response, path, result['sha256'], result['size'])
+    metrics.count('files_downloaded')
+    return changed
+
+
+def extract_hrefs(content):
+    if not content or not content.strip():
+        return []
+    try:
+        import lxml.html
+    except ImportError:
+        return [a['href'] for a in BeautifulSoup(content, 'html.parser').find_all('a', href=True)]
+    return lxml.html.fromstring(content).xpath('//a/@href')
+
+
+def find_excel_links(session, limiter, url, host):
+    limiter.acquire(url)
+    with metrics.stage('listing'):
+        response = session.get(url, timeout=15)
+    response.raise_for_status()
+    metrics.count('pages')
+    
+    excel_links = {}
+    for href in extract_hrefs(response.content):
+        if any(pattern in href for pattern in EXCEL_LINK_PATTERNS):
+            excel_links.setdefault(urljoin(host, href), None)
+    return list(excel_links)
+
+
+def listing_url(base_url, page):
+    return base_url if page == 1 else f"{base_url}?page={page}"
+
+
+async def crawl_listing(session, limiter, base_url, host, workers=DOWNLOAD_WORKERS, max_pages=LISTING_MAX_PAGES):
+    seen = set()
+    links = []
+    failed = []
+    page = 1
+    
+    def fetch_pages(pages):
+        return asyncio.gather(
+            *(asyncio.to_thread(find_excel_links, session, limiter, listing_url(base_url, p), host) for p in pages),
+            return_exceptions=True)
+    
+    def add_links(p, found):
+        new_links = [u for u in found if u not in seen]
+        seen.update(new_links)
+        links.extend((u, listing_url(base_url, p)) for u in new_links)
+        return new_links
+    
+    while page <= max_pages:
+        batch = list(range(page, min(page + max(1, workers), max_pages + 1)))
+        results = await fetch_pages(batch)
+        
+        exhausted = False
+        for p, found in zip(batch, results):
+            if isinstance(found, Exception):
+                print(f"Ошибка при обработке страницы {p}: {str(found)}, страница будет запрошена повторно")
+                failed.append(p)
+            elif not add_links(p, found):
+                exhausted = True
+        
+        if exhausted:
+            break
+        page += len(batch)
+    
+    if failed:
+        for p, found in zip(failed, await fetch_pages(failed)):
+            if isinstance(found, Exception):
+                print(f"Страница {p} пропущена: {str(found)}")
+            else:
+                add_links(p, found)
+    
+    return links
+
+
+async def discover_excel_links(session, limiter, configs, host, workers=DOWNLOAD_WORKERS):
+    return await asyncio.gather(
+        *(crawl_listing(session, limiter, config['base_url'], host, workers, config['max_pages']) for config in configs))
+
+
+def download_customs_file(session, limiter, config, excel_url, referer, manifest):
+    url_hash = hashlib.md5(excel_url.encode()).hexdigest()[:12]
+    
+    if '.xls' in excel_url.lower():
+        if excel_url.lower().endswith('.xlsx'):
+            extension = '.xlsx'
+        elif excel_url.lower().endswith('.xls'):
+            extension = '.xls'
+        else:
+            extension = '.xlsx'
+    else:
+        extension = '.xlsx'
+    
+    filename = f"{config['name']}_{url_hash}{extension}"
+    filepath = os.path.join(config['download_dir'], filename)
+    
+    entry = manifest['files'].get(excel_url)
+    known_path = None
+    if entry and os.path.exists(entry['path']):
+        known_path = entry['path']
+    else:
+        entry = None
+        for ext in ('.xlsx', '.xls'):
+            candidate = os.path.join(config['download_dir'], f"{config['name']}_{url_hash}{ext}")
+            if os.path.exists(candidate):
+                known_path = candidate
+                break
+    
+    file_headers = {
+        'Accept': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet,application/vnd.ms-excel,*/*',
+        'Referer': referer,
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'same-origin'
+    }
+    file_headers.update(conditional_headers(entry, known_path))
+    
+    limiter.acquire(excel_url)
+    with metrics.stage('download'):
+        file_response = session.get(excel_url, headers=file_headers, timeout=30, stream=True)
+    
+    try:
+        if file_response.status_code == 304 and known_path:
+            print(f"Файл не изменился: {os.path.basename(known_path)}")
+            metrics.count('not_modified')
+            record_download(manifest, excel_url, file_response, known_path)
+            return known_path
+        
+        with metrics.stage('download'):
+            result = stream_to_temp(file_response, config['download_dir'])
+    finally:
+        file_response.close()
+
+    if not result['head']:
+        print(f"Файл пустой - {filename}")
+        return None
+    
+    if result['kind'] is None:
+        print(f"Файл не является валидным Excel: {filename}")
+        content_start = result['head'][:200].decode('utf-8', errors='ignore').lower()
+        if '<html' in content_start or '<!doctype' in content_start:
+            print("Обнаружена HTML страница вместо файла")
+        return None
+
+    if result['kind'] != extension:
+        print(f"  Обнаружен реальный формат: {result['kind']}")
+        filename = f"{config['name']}_{url_hash}{result['kind']}"
+        filepath = os.path.join(config['download_dir'], filename)
+    
+    os.replace(result['tmp_path'], filepath)
+    if known_path and known_path != filepath:
+        os.remove(known_path)
+    record_download(manifest, excel_url, file_response, filepath, result['sha256'], result['size'])
+    metrics.count('files_downloaded')
+    metrics.emit('download', url=excel_url, file=filepath, bytes=result['size'])
+    return filepath
+
+
+def download_customs_data(host=CUSTOMS_HOST, workers=DOWNLOAD_WORKERS, rate=REQUESTS_PER_SECOND, manifest=None):
     configs = [
         {
             'name': 'export',
-            'base_url': 'https://customs.gov.ru/statistic/eksport-rossii-vazhnejshix-tovarov',
-            'download_dir': 'export_data',
-            'pages': range(1, 4)
+            'base_url': f'{host}/statistic/eksport-rossii-vazhnejshix-tovarov',
+            'download_dir': os.path.join(DATA_DIR, 'export'),
+            'max_pages': LISTING_MAX_PAGES
         },
         {
             'name': 'import',
-            'base_url': 'https://customs.gov.ru/folder/515',
-            'download_dir': 'import_data',
-            'pages': range(1, 4)
+            'base_url': f'{host}/folder/515',
+            'download_dir': os.path.join(DATA_DIR, 'import'),
+            'max_pages': LISTING_MAX_PAGES
         }
     ]
     
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-        'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'DNT': '1',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none',
-        'Cache-Control': 'max-age=0',
-    }
-    
-    session = requests.Session()
-    session.headers.update(headers)
+    session = make_session(BROWSER_HEADERS, pool_size=workers)
+    limiter = HostRateLimiter(rate)
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = load_download_manifest()
     
     all_downloaded_files = {}
     
     try:
     
-        response = session.get("https://customs.gov.ru/", timeout=10)
-        
-        time.sleep(2)
+        limiter.acquire(host)
+        response = session.get(f"{host}/", timeout=10)
         
         for config in configs:
             
             if not os.path.exists(config['download_dir']):
                 os.makedirs(config['download_dir'])
             
-            downloaded_files = []
-            
-            for page in config['pages']:
-                if page == 1:
-                    url = config['base_url']
-                else:
-                    url = f"{config['base_url']}?page={page}"
-                
-                try:
-                    response = session.get(url, timeout=15)
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    
-                    links = soup.find_all('a', href=True)
-                    excel_links = []
-                    
-                    for link in links:
-                        href = link['href']
-                        if any(pattern in href for pattern in ['document_statistics_file', '.xlsx', '.xls']):
-                            full_url = urljoin('https://customs.gov.ru', href)
-                            if full_url not in excel_links:
-                                excel_links.append(full_url)
-                    
-                    for i, excel_url in enumerate(excel_links):
-                        try:
-                            url_hash = hashlib.md5(excel_url.encode()).hexdigest()[:12]
-                            
-                            if '.xls' in excel_url.lower():
-                                if excel_url.lower().endswith('.xlsx'):
-                                    extension = '.xlsx'
-                                elif excel_url.lower().endswith('.xls'):
-                                    extension = '.xls'
-                                else:
-                                    extension = '.xlsx'
-                            else:
-                                extension = '.xlsx'
-                            
-                            filename = f"{config['name']}_{url_hash}{extension}"
-                            filepath = os.path.join(config['download_dir'], filename)
-                            
-                            if os.path.exists(filepath):
-                                file_size = os.path.getsize(filepath)
-                                print(f"Файл уже существует: {filename} ({file_size} байт)")
-                                downloaded_files.append(filepath)
-                                continue
-                            
-                            file_headers = headers.copy()
-                            file_headers.update({
-                                'Accept': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet,application/vnd.ms-excel,*/*',
-                                'Referer': url,
-                                'Sec-Fetch-Dest': 'document',
-                                'Sec-Fetch-Mode': 'navigate',
-                                'Sec-Fetch-Site': 'same-origin'
-                            })
-                            
-                            file_response = session.get(excel_url, headers=file_headers, timeout=30)
-                            content = file_response.content
-                    
-                            if len(content) >= 8:
-                                if content[:2] == b'PK':
-                                    actual_extension = '.xlsx'
-                                elif content[:8] == b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1':
-                                    actual_extension = '.xls'
-                                else:
-                                    actual_extension = extension 
-                                
-                                if actual_extension != extension:
-                                    print(f"  Обнаружен реальный формат: {actual_extension}")
-                                    new_filename = f"{config['name']}_{url_hash}{actual_extension}"
-                                    new_filepath = os.path.join(config['download_dir'], new_filename)
-                                    
-                                    if os.path.exists(new_filepath):
-                                        print(f"Файл уже существует: {new_filename}")
-                                        downloaded_files.append(new_filepath)
-                                        continue
-                                    
-                                    filename = new_filename
-                                    filepath = new_filepath
-                            
-                            with open(filepath, 'wb') as f:
-                                f.write(content)
-                            
-                            file_size = os.path.getsize(filepath)
-                            if file_size == 0:
-                                print(f"Файл пустой - {filename}")
-                                os.remove(filepath)
-                                continue
-                            
-                            with open(filepath, 'rb') as f:
-                                file_start = f.read(8)
-                            
-                            is_valid_excel = False
-                            if file_start[:2] == b'PK':  # XLSX
-                                is_valid_excel = True
-                            elif file_start[:8] == b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1':  # XLS
-                                is_valid_excel = True
-                            
-                            if is_valid_excel:
-                                downloaded_files.append(filepath)
-                            else:
-                                print(f"Файл не является валидным Excel: {filename}")
-                                try:
-                                    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                                        content_start = f.read(200)
-                                        if '<html' in content_start.lower() or '<!doctype' in content_start.lower():
-                                            print("Обнаружена HTML страница вместо файла")
-                                except:
-                                    pass
-                                os.remove(filepath)
-                            
-                            time.sleep(2)  
-                            
-                        except Exception as e:
-                            print(f"Ошибка при скачивании: {str(e)}")
-                    
-                except Exception as e:
-                    print(f"Ошибка при обработке страницы {page}: {str(e)}")
-            
-            all_downloaded_files[config['name']] = downloaded_files
+            all_downloaded_files[config['name']] = []
+        
+        tasks = []
+        found = asyncio.run(discover_excel_links(session, limiter, configs, host, workers))
+        for config, links in zip(configs, found):
+            print(f"{config['name']}: найдено файлов {len(links)}")
+            for excel_url, referer in links:
+                tasks.append((config, excel_url, referer))
+
+        def run_task(task):
+            config, excel_url, referer = task
+            try:
+                return config['name'], download_customs_file(session, limiter, config, excel_url, referer, manifest)
+            except Exception as e:
+                print(f"Ошибка при скачивании: {str(e)}")
+                return config['name'], None
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for name, filepath in executor.map(run_task, tasks):
+                if filepath and filepath not in all_downloaded_files[name]:
+                    all_downloaded_files[name].append(filepath)
         
         total_files = 0
         for data_type, files in all_downloaded_files.items():
@@ -185,13 +435,69 @@ def download_customs_data():
             else:
                 print("  - Файлы не скачаны")
         
+        if own_manifest:
+            save_download_manifest(manifest)
+        return all_downloaded_files
             
     except Exception as e:
         print(f"Критическая ошибка: {str(e)}")
 
 
-def download_rosstat_electricity():
+ELECTRICITY_OUTPUT_BASE = "electricity_consumption_2017-2024_percent"
+ELECTRICITY_DTYPES = {'Регион': 'category', **{str(y): 'float64' for y in range(2017, 2025)}}
+
+
+ELECTRICITY_YEAR_COLS = ['2017', '2018', '2019', '2020', '2021', '2022', '2023', '2024']
+ELECTRICITY_SKIP_REGIONS = [
+    'Российская Федерация',
+    'Центральный федеральный округ',
+    'Северо-Западный федеральный округ', 
+    'Южный федеральный округ',
+    'Архангельская область',
+    'Северо-Кавказский федеральный округ',
+    'Приволжский федеральный округ',
+    'Уральский федеральный округ',
+    'Сибирский федеральный округ',
+    'Дальневосточный федеральный округ',
+    'Тюменская область'
+]
+
+
+def electricity_shares(df):
+    year_cols = ELECTRICITY_YEAR_COLS
+    
+    df = df.iloc[2:, [0] + list(range(13, 21))].reset_index(drop=True)
+    df.columns = ['Регион'] + year_cols
+    df[year_cols] = df[year_cols].apply(pd.to_numeric, errors='coerce')
+    df['Регион'] = df['Регион'].astype(str).str.strip()
+    
+    df = df[~df['Регион'].isin(ELECTRICITY_SKIP_REGIONS) & ~df['Регион'].isin(['nan', ''])]
+    df_merged = df.groupby('Регион', sort=False, as_index=False)[year_cols].sum(min_count=1)
+    
+    values = df_merged[year_cols]
+    mask = values.notna().any(axis=1) & (values != 0).any(axis=1)
+    df_filtered = df_merged[mask].reset_index(drop=True)
+    
+    if len(df_filtered) > 1:
+        second_row_data = df_filtered.loc[1, year_cols]
+        if second_row_data.isna().all() or (second_row_data == 0).all():
+            df_filtered = df_filtered.drop(1).reset_index(drop=True)
+    
+    totals = df_filtered[year_cols].sum()
+    df_percent = df_filtered.copy()
+    df_percent[year_cols] = (df_filtered[year_cols] / totals.where(totals > 0)) * 100
+    df_percent[totals.index[~(totals > 0)]] = 0
+    df_percent[year_cols] = df_percent[year_cols].round(4)
+    
+    return df_percent
+
+
+def download_rosstat_electricity(manifest=None, formats=('xlsx',)):
     url = "https://rosstat.gov.ru/storage/mediabank/elbalans_2024.xlsx"
+    output_filename = outputs.output_path(ELECTRICITY_OUTPUT_BASE, formats[0])
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = load_download_manifest()
     
     session = requests.Session()
     
@@ -204,97 +510,23 @@ def download_rosstat_electricity():
     try:
         session.get("https://rosstat.gov.ru/", verify=False, timeout=60)
         
-        response = session.get(url, headers=headers, verify=False, timeout=30)
-        response.raise_for_status()
-        
         filename = "elbalans_2024.xlsx"
-        with open(filename, 'wb') as f:
-            f.write(response.content)
+        changed = fetch_with_manifest(session, url, filename, manifest, headers, verify=False, timeout=30)
+        if own_manifest:
+            save_download_manifest(manifest)
         
-        df = pd.read_excel(filename, sheet_name=21, header=None)
-    
-        df = df.iloc[2:].reset_index(drop=True)
-        selected_columns = [0] + list(range(13, 21)) 
-        
-        df = df.iloc[:, selected_columns]
+        if not changed and os.path.exists(output_filename):
+            print(f"Источник не изменился, {output_filename} актуален")
+            return output_filename
         
-        df.columns = ['Регион', '2017', '2018', '2019', '2020', '2021', '2022', '2023', '2024']
+        with metrics.stage('electricity.decode'):
+            df = pd.read_excel(filename, sheet_name=21, header=None)
     
-        year_cols = ['2017', '2018', '2019', '2020', '2021', '2022', '2023', '2024']
-        
-        for col in year_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        df['Регион'] = df['Регион'].astype(str).str.strip()
-        
-        regions_to_remove = [
-            'Российская Федерация',
-            'Центральный федеральный округ',
-            'Северо-Западный федеральный округ', 
-            'Южный федеральный округ',
-            'Архангельская область',
-            'Северо-Кавказский федеральный округ',
-            'Приволжский федеральный округ',
-            'Уральский федеральный округ',
-            'Сибирский федеральный округ',
-            'Дальневосточный федеральный округ',
-            'Тюменская область'
-        ]
-        
-        df = df[~df['Регион'].isin(regions_to_remove)]
-        merged_data = {}
-        
-        for idx, row in df.iterrows():
-            region = row['Регион']
-            
-            if pd.isna(region) or region == 'nan' or region == '':
-                continue
-                
-            if region not in merged_data:
-                merged_data[region] = row.copy()
-            else:
-                for year in year_cols:
-                    current_value = merged_data[region][year]
-                    new_value = row[year]
-                    
-                    if pd.isna(current_value) and not pd.isna(new_value):
-                        merged_data[region][year] = new_value
-                    elif not pd.isna(current_value) and not pd.isna(new_value):
-                        merged_data[region][year] = current_value + new_value
-        
-        df_merged = pd.DataFrame(list(merged_data.values()))
-        
-        mask = df_merged[year_cols].notna().any(axis=1) & (df_merged[year_cols] != 0).any(axis=1)
-        df_filtered = df_merged[mask].reset_index(drop=True)
-        
-        if len(df_filtered) > 1:
-            second_row_region = df_filtered.loc[1, 'Регион']
-            if pd.isna(second_row_region) or second_row_region == 'nan' or second_row_region == '':
-                df_filtered = df_filtered.drop(1).reset_index(drop=True)
-            else:
-                second_row_data = df_filtered.loc[1, year_cols]
-                if second_row_data.isna().all() or (second_row_data == 0).all():
-                    df_filtered = df_filtered.drop(1).reset_index(drop=True)
-        
-        df_percent = df_filtered.copy()
-        
-        for year in year_cols:
-            total = df_filtered[year].sum()
-            if total > 0:  
-                df_percent[year] = (df_filtered[year] / total) * 100
-            else:
-                df_percent[year] = 0
+        with metrics.stage('electricity.transform'):
+            df_percent = electricity_shares(df)
         
-        for year in year_cols:
-            df_percent[year] = df_percent[year].round(4)
-        
-        output_filename = "electricity_consumption_2017-2024_percent.xlsx"
-        df_percent.to_excel(output_filename, index=False)
-        
-        try:
-            os.remove(filename)
-        except:
-            print(f"Не удалось удалить временный файл {filename}")
+        with metrics.stage('write'):
+            outputs.write_table(df_percent, ELECTRICITY_OUTPUT_BASE, formats, ELECTRICITY_DTYPES)
         
         return output_filename
         
@@ -305,9 +537,41 @@ def download_rosstat_electricity():
         return None
     
 
-def download_rosstat_table():
+PRODUCTION_OUTPUT = os.path.join(DATA_DIR, 'production', 'metallurgy_data_processed.xlsx')
+
+
+def scale_thousands(df, start_row=3):
+    df = df.copy()
+    block = df.iloc[start_row:, 1:]
+    if block.empty:
+        return df
+    
+    cells = pd.Series(block.to_numpy(dtype=object).ravel())
+    as_text = cells.astype(str)
+    is_number = cells.notna() & as_text.str.replace(',', '', regex=False).str.replace('.', '', regex=False).str.isdigit()
+    numbers = pd.to_numeric(as_text.where(is_number).str.replace(',', '.', regex=False), errors='coerce')
+    
+    converted = numbers.notna().to_numpy().reshape(block.shape)
+    scaled = (numbers / 1000).to_numpy().reshape(block.shape)
+    
+    for pos, col in enumerate(block.columns):
+        rows = converted[:, pos]
+        if not rows.any():
+            continue
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = df[col].astype('float64')
+        df.loc[block.index[rows], col] = scaled[rows, pos]
+    
+    return df
+
+
+def download_rosstat_table(manifest=None):
     
     url = "https://rosstat.gov.ru/storage/mediabank/Proizvodstvo_mes_2017-2024.xlsx"
+    metallurgy_filename = PRODUCTION_OUTPUT
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = load_download_manifest()
     
     session = requests.Session()
     
@@ -321,31 +585,29 @@ def download_rosstat_table():
         
         session.get("https://rosstat.gov.ru/", verify=False, timeout=60)
         
-        response = session.get(url, headers=headers, verify=False, timeout=30)
-        response.raise_for_status()
-        
         filename = "Proizvodstvo_mes_2017-2024.xlsx"
-        with open(filename, 'wb') as f:
-            f.write(response.content)
+        changed = fetch_with_manifest(session, url, filename, manifest, headers, verify=False, timeout=30)
+        if own_manifest:
+            save_download_manifest(manifest)
+        
+        if not changed and os.path.exists(metallurgy_filename):
+            print(f"Источник не изменился, {metallurgy_filename} актуален")
+            return metallurgy_filename
         
         target_sheet = "24"
         
-        df = pd.read_excel(filename, sheet_name=target_sheet)
+        with metrics.stage('production.decode'):
+            df = pd.read_excel(filename, sheet_name=target_sheet)
         
         df = df.iloc[2:].reset_index(drop=True)
         
-        for i in range(3, len(df)):
-            for col in df.columns[1:]: 
-                try:
-                    value = df.at[i, col]
-                    if pd.notna(value) and str(value).replace(',', '').replace('.', '').isdigit():
-                        numeric_value = float(str(value).replace(',', '.'))
-                        df.at[i, col] = numeric_value / 1000
-                except (ValueError, TypeError):
-                    pass
+        with metrics.stage('production.transform'):
+            df = scale_thousands(df)
         
-        metallurgy_filename = "metallurgy_data_processed.xlsx"
-        df.to_excel(metallurgy_filename, index=False)
+        os.makedirs(os.path.dirname(metallurgy_filename), exist_ok=True)
+        with metrics.stage('write'):
+            df.to_excel(metallurgy_filename, index=False)
+        return metallurgy_filename
         
     except Exception as e:
         print(f"Ошибка: {e}")
@@ -353,7 +615,24 @@ def download_rosstat_table():
 
 
 
+def run_cli(argv=None):
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--metrics', nargs='?', const='-', metavar='PATH',
+                            help='писать время этапов и счётчики в JSON-лог (без пути - в stderr)')
+    arg_parser.add_argument('--profile', metavar='DIR',
+                            help='сохранить cProfile каждого этапа в папку')
+    args = arg_parser.parse_args(argv)
+    if args.metrics or args.profile:
+        metrics.configure(args.metrics, args.profile)
+
+    with metrics.stage('customs'):
+        download_customs_data()
+    with metrics.stage('electricity'):
+        download_rosstat_electricity()
+    with metrics.stage('production'):
+        download_rosstat_table()
+    metrics.report('parser')
+
+
 if __name__ == "__main__":
-    download_customs_data()
-    download_rosstat_electricity()
-    download_rosstat_table()
+    run_cli()
@@ -0,0 +1,314 @@
+import os
+import glob
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import parser
+import process_data
+import regional
+import forecast
+import outputs
+import metrics
+
+PIPELINE_STATE = os.path.join(process_data.CACHE_DIR, 'pipeline.json')
+STATE_LOCK = threading.Lock()
+LAYOUT_LOCK = threading.Lock()
+JOBS = 3
+DEFAULT_TARGETS = ['regional', 'forecast']
+
+
+def customs_files(flow):
+    return process_data.list_customs_files(os.path.join(process_data.BASE_DIR, flow))
+
+
+def production_files():
+    return sorted(glob.glob(os.path.join(process_data.BASE_DIR, 'production', '*.xlsx')))
+
+
+def output_files(base_path, formats):
+    return [outputs.output_path(base_path, fmt) for fmt in formats]
+
+
+def run_customs_download(ctx):
+    parser.download_customs_data(workers=ctx['workers'], manifest=ctx['manifest'])
+
+
+def run_electricity_download(ctx):
+    parser.download_rosstat_electricity(ctx['manifest'], ctx['formats'])
+
+
+def run_production_download(ctx):
+    parser.download_rosstat_table(ctx['manifest'])
+
+
+def run_parse(flow, type_name):
+    def run(ctx):
+        layouts = process_data.load_layout_cache()
+        process_data.collect_customs_outputs(customs_files(flow), type_name, ctx['workers'], use_cache=True,
+                                             executor=ctx['executor'], layouts=layouts)
+        with LAYOUT_LOCK:
+            saved = process_data.load_layout_cache()
+            saved.update(layouts)
+            process_data.save_layout_cache(saved)
+    return run
+
+
+def run_merge(ctx):
+    process_data.main(workers=ctx['workers'], use_cache=True, incremental=True, formats=ctx['formats'],
+                      executor=ctx['executor'])
+
+
+def run_regional(ctx):
+    regional.main(outputs.find_existing_output(regional.DEMAND_BASE, ctx['formats']),
+                  outputs.find_existing_output(regional.SHARES_BASE), ctx['formats'])
+
+
+def run_forecast(ctx):
+    forecast.main(outputs.find_existing_output(regional.DEMAND_BASE, ctx['formats']), formats=ctx['formats'])
+
+
+def merge_inputs(ctx):
+    return (customs_files('import') + customs_files('export') + production_files()
+            + [process_data.MAPPING_FILE])
+
+
+def regional_inputs(ctx):
+    return output_files(regional.DEMAND_BASE, ctx['formats']) + [outputs.find_existing_output(regional.SHARES_BASE)]
+
+
+STAGES = {
+    'download.customs': {
+        'deps': [],
+        'inputs': lambda ctx: [],
+        'outputs': lambda ctx: customs_files('import') + customs_files('export'),
+        'run': run_customs_download,
+        'network': True,
+    },
+    'download.electricity': {
+        'deps': [],
+        'inputs': lambda ctx: [],
+        'outputs': lambda ctx: output_files(parser.ELECTRICITY_OUTPUT_BASE, ctx['formats'][:1]),
+        'run': run_electricity_download,
+        'network': True,
+    },
+    'download.production': {
+        'deps': [],
+        'inputs': lambda ctx: [],
+        'outputs': lambda ctx: [parser.PRODUCTION_OUTPUT],
+        'run': run_production_download,
+        'network': True,
+    },
+    'parse.import': {
+        'deps': ['download.customs'],
+        'inputs': lambda ctx: customs_files('import') + [process_data.MAPPING_FILE],
+        'outputs': lambda ctx: [],
+        'run': run_parse('import', 'Import'),
+    },
+    'parse.export': {
+        'deps': ['download.customs'],
+        'inputs': lambda ctx: customs_files('export') + [process_data.MAPPING_FILE],
+        'outputs': lambda ctx: [],
+        'run': run_parse('export', 'Export'),
+    },
+    'merge': {
+        'deps': ['parse.import', 'parse.export', 'download.production'],
+        'inputs': merge_inputs,
+        'outputs': lambda ctx: output_files(process_data.OUTPUT_BASE, ctx['formats']),
+        'run': run_merge,
+    },
+    'regional': {
+        'deps': ['merge', 'download.electricity'],
+        'inputs': regional_inputs,
+        'outputs': lambda ctx: output_files(regional.RES_BASE, ctx['formats']),
+        'run': run_regional,
+    },
+    'forecast': {
+        'deps': ['merge'],
+        'inputs': lambda ctx: output_files(regional.DEMAND_BASE, ctx['formats']),
+        'outputs': lambda ctx: output_files(forecast.FORECAST_BASE, ctx['formats']),
+        'run': run_forecast,
+    },
+}
+
+
+def fingerprint(paths):
+    result = {}
+    for path in paths:
+        if not path:
+            continue
+        try:
+            st = os.stat(path)
+            result[path] = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            result[path] = None
+    return result
+
+
+def missing_outputs(stage, outputs_fp):
+    if stage.get('network') and not outputs_fp:
+        return True
+    return any(v is None for v in outputs_fp.values())
+
+
+def load_state(path=PIPELINE_STATE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Не читается состояние конвейера {path}: {e}")
+        return {}
+
+
+def save_state(state, path=PIPELINE_STATE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with STATE_LOCK:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+
+def stale_reason(name, ctx, state):
+    stage = STAGES[name]
+    if ctx['force']:
+        return 'принудительно'
+
+    outputs_fp = fingerprint(stage['outputs'](ctx))
+    if missing_outputs(stage, outputs_fp):
+        return 'нет результата'
+    if stage.get('network'):
+        return 'обновление источника' if ctx['refresh'] else None
+
+    previous = state.get(name)
+    if previous is None:
+        return 'не запускался'
+    if previous['inputs'] != fingerprint(stage['inputs'](ctx)):
+        return 'изменились входные файлы'
+    if previous['outputs'] != outputs_fp:
+        return 'изменился результат'
+    return None
+
+
+def select_stages(targets):
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(STAGES[name]['deps'])
+    return [name for name in STAGES if name in selected]
+
+
+def run_stage(name, ctx, state):
+    stage = STAGES[name]
+    reason = stale_reason(name, ctx, state)
+    if reason is None:
+        print(f"[{name}] актуален")
+        return 'skipped'
+    if ctx['dry_run']:
+        print(f"[{name}] будет выполнен: {reason}")
+        return 'dry-run'
+
+    print(f"[{name}] выполняется: {reason}")
+    with metrics.stage(name):
+        stage['run'](ctx)
+
+    outputs_fp = fingerprint(stage['outputs'](ctx))
+    if missing_outputs(stage, outputs_fp):
+        print(f"[{name}] ошибка: нет результата")
+        return 'failed'
+
+    if stage.get('network'):
+        parser.save_download_manifest(ctx['manifest'])
+    with STATE_LOCK:
+        state[name] = {'inputs': fingerprint(stage['inputs'](ctx)), 'outputs': outputs_fp}
+    save_state(state)
+    return 'done'
+
+
+def run_pipeline(targets=DEFAULT_TARGETS, jobs=JOBS, workers=1, formats=('xlsx',), force=False, refresh=False,
+                 dry_run=False):
+    ctx = {
+        'workers': workers,
+        'formats': list(formats),
+        'force': force,
+        'refresh': refresh,
+        'dry_run': dry_run,
+        'manifest': parser.load_download_manifest(),
+        'executor': None,
+    }
+    state = load_state()
+    names = select_stages(targets)
+
+    if workers > 1:
+        ctx['executor'] = ProcessPoolExecutor(max_workers=workers)
+    try:
+        status = run_stages(names, ctx, state, jobs)
+    finally:
+        if ctx['executor'] is not None:
+            ctx['executor'].shutdown()
+
+    print("Итог: " + ", ".join(f"{name} - {status[name]}" for name in names))
+    metrics.report('pipeline')
+    return status
+
+
+def run_stages(names, ctx, state, jobs):
+    status = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        while len(status) < len(names):
+            for name in names:
+                if name in status or name in running.values():
+                    continue
+                deps = STAGES[name]['deps']
+                if any(status.get(d) == 'failed' for d in deps if d in names):
+                    print(f"[{name}] пропущен: не выполнена зависимость")
+                    status[name] = 'failed'
+                elif all(d in status for d in deps if d in names):
+                    running[executor.submit(run_stage, name, ctx, state)] = name
+
+            if not running:
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    status[name] = future.result()
+                except Exception as e:
+                    print(f"[{name}] ошибка: {e}")
+                    status[name] = 'failed'
+    return status
+
+
+def run_cli(argv=None):
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS,
+                            help=f"конечные этапы: {', '.join(STAGES)} (по умолчанию весь конвейер до regional и forecast)")
+    arg_parser.add_argument('--jobs', type=int, default=JOBS, help='сколько этапов выполнять одновременно')
+    arg_parser.add_argument('--workers', type=int, default=process_data.WORKERS,
+                            help='число процессов для разбора таможенных файлов')
+    arg_parser.add_argument('--format', nargs='+', choices=outputs.OUTPUT_FORMATS, default=['xlsx'],
+                            help='форматы итоговых таблиц')
+    arg_parser.add_argument('--force', action='store_true', help='выполнить все выбранные этапы')
+    arg_parser.add_argument('--refresh', action='store_true', help='проверить источники на сайтах')
+    arg_parser.add_argument('--dry-run', action='store_true', help='только показать устаревшие этапы')
+    arg_parser.add_argument('--metrics', nargs='?', const='-', metavar='PATH',
+                            help='писать время этапов и счётчики в JSON-лог (без пути - в stderr)')
+    args = arg_parser.parse_args(argv)
+    unknown = [t for t in args.targets if t not in STAGES]
+    if unknown:
+        arg_parser.error(f"неизвестные этапы: {', '.join(unknown)}")
+    if args.metrics:
+        metrics.configure(args.metrics)
+    run_pipeline(args.targets, args.jobs, max(1, args.workers), args.format,
+                 args.force, args.refresh, args.dry_run)
+
+
+if __name__ == "__main__":
+    run_cli()
@@ -1,13 +1,48 @@
 import pandas as pd
+import numpy as np
 import os
 import glob
 import re
+import io
+import csv
+import time
+import datetime
+import hashlib
+import json
+import zipfile
+import argparse
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import outputs
+import mapping
+import metrics
+import inventory
 
 warnings.filterwarnings("ignore")
 
 BASE_DIR = 'data' 
-OUTPUT_FILE = 'final_demand_metallurgy_clean.xlsx'
+OUTPUT_BASE = 'final_demand_metallurgy_clean'
+OUTPUT_FILE = OUTPUT_BASE + '.xlsx'
+WORKERS = os.cpu_count() or 1
+HEADER_SCAN_ROWS = 40
+
+ZIP_MAGIC = b'PK\x03\x04'
+OLE2_MAGIC = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1'
+FORMAT_ENGINES = {'xlsx': 'openpyxl', 'xls': 'xlrd'}
+
+EXCEL_NA_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+}
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+PARSER_VERSION = '4'
+MAPPING_FILE = mapping.MAPPING_FILE
+CODE_MATCHERS = {}
+INPUTS_MANIFEST = os.path.join(CACHE_DIR, 'inputs.json')
+KEY_COLS = ['Year', 'Month', 'Product']
+FLOWS = ['Production', 'Import', 'Export']
+FLOWS_KEEP_NAN = ['Production']
 
 MONTHS_RU = {
     'январь': 1, 'января': 1,
@@ -25,30 +60,188 @@ MONTHS_RU = {
 }
 
 
-BRIDGE_MAP = {
-    "Руда железная товарная необогащенная, тыс.т": ["2601"],
-    "Концентрат железорудный, тыс.т": ["260111"], 
-    "Чугун зеркальный и передельный в чушках, болванках или в прочих первичных формах, тыс.т": ["7201"],
-    "Сталь нелегированная в слитках или в прочих первичных формах и полуфабрикаты из нелегированной стали, т": ["7206", "7207"],
-    "Сталь нержавеющая в слитках или прочих первичных формах и полуфабрикаты из нержавеющей стали,т": ["7218"],
-    "Сталь легированная прочая в слитках или в прочих первичных формах и полуфабрикаты из прочей легированной стали,т": ["7224"],
-    "Прокат готовый, т": ["7208", "7209", "7210", "7211", "7212", "7213", "7214", "7215", "7216", "7219", "7220", "7221", "7222", "7225", "7226", "7227", "7228"],
-    "Трубы, профили пустотелые и их фитинги стальные, т": ["7304", "7305", "7306", "7307"]
-}
-
-
 def clean_product_name(name):
     clean = re.sub(r',?\s*(тыс\.?)?\s*т\.?$', '', str(name), flags=re.IGNORECASE)
     return clean.strip()
 
-def read_excel_robust(filepath):
-    engines = [None, 'xlrd', 'openpyxl']
-    for eng in engines:
+def detect_file_format(filepath):
+    try:
+        with open(filepath, 'rb') as f:
+            head = f.read(512)
+    except OSError:
+        return 'missing'
+    
+    if not head:
+        return 'empty'
+    if head[:4] == ZIP_MAGIC:
+        return 'xlsx'
+    if head[:8] == OLE2_MAGIC:
+        return 'xls'
+    
+    text = head.decode('utf-8', errors='ignore').lstrip('\ufeff').lstrip().lower()
+    if text.startswith(('<!doctype html', '<html', '<table')) or '<html' in text:
+        return 'html'
+    if text.startswith('<'):
+        return 'unknown'
+    if b'\x00' not in head:
+        return 'csv'
+    return 'unknown'
+
+def _html_table_to_raw(df):
+    if list(df.columns) == list(range(df.shape[1])):
+        return df
+    if isinstance(df.columns, pd.MultiIndex):
+        header = [df.columns.get_level_values(i).tolist() for i in range(df.columns.nlevels)]
+    else:
+        header = [df.columns.tolist()]
+    header = [[np.nan if str(v).startswith('Unnamed:') else v for v in row] for row in header]
+    return pd.DataFrame(header + df.values.tolist())
+
+def _apply_read_kwargs(df, nrows=None, skiprows=None, usecols=None, dtype=None):
+    if skiprows:
+        df = df.iloc[skiprows:].reset_index(drop=True)
+    if nrows is not None:
+        df = df.head(nrows)
+    if usecols is not None:
+        df = df[[c for c in usecols if c in df.columns]]
+    if dtype is not None:
+        df = df.astype(dtype)
+    return df
+
+def _read_by_format(filepath, fmt, read_kwargs):
+    if fmt in FORMAT_ENGINES:
+        return pd.read_excel(filepath, header=None, engine=FORMAT_ENGINES[fmt], **read_kwargs)
+    
+    if fmt == 'html':
+        with open(filepath, 'rb') as f:
+            raw = f.read()
         try:
-            return pd.read_excel(filepath, header=None, engine=eng)
-        except:
-            continue
-    return None
+            text = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            text = raw.decode('cp1251', errors='replace')
+        tables = pd.read_html(io.StringIO(text), thousands=None)
+        if not tables:
+            raise ValueError("в HTML нет таблиц")
+        df = max(tables, key=lambda t: t.size)
+        return _apply_read_kwargs(_html_table_to_raw(df), **read_kwargs)
+    
+    if fmt == 'csv':
+        last_error = None
+        for encoding in ('utf-8-sig', 'cp1251'):
+            try:
+                with open(filepath, 'r', encoding=encoding) as f:
+                    sample = f.read(8192)
+                delimiter = csv.Sniffer().sniff(sample, delimiters=';\t,').delimiter
+                return pd.read_csv(filepath, header=None, sep=delimiter, encoding=encoding, **read_kwargs)
+            except UnicodeDecodeError as e:
+                last_error = e
+        raise last_error
+    
+    raise ValueError(f"неподдерживаемый формат: {fmt}")
+
+def read_excel_checked(filepath, **read_kwargs):
+    fmt = detect_file_format(filepath)
+    error = {'file': os.path.basename(filepath), 'format': fmt, 'reason': None}
+    
+    if fmt in ('missing', 'empty', 'unknown'):
+        error['reason'] = {'missing': 'файл не найден', 'empty': 'пустой файл', 'unknown': 'неизвестный формат'}[fmt]
+        return None, error
+    
+    try:
+        return _read_by_format(filepath, fmt, read_kwargs), None
+    except Exception as e:
+        error['reason'] = f"{type(e).__name__}: {e}"
+        return None, error
+
+def read_excel_robust(filepath, **read_kwargs):
+    return read_excel_checked(filepath, **read_kwargs)[0]
+
+def read_excel_head(filepath, nrows=HEADER_SCAN_ROWS + 2):
+    return read_excel_checked(filepath, nrows=nrows, dtype=object)
+
+def _excel_value(value):
+    if value is None:
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in EXCEL_NA_STRINGS:
+        return np.nan
+    return value
+
+def _read_xlsx_columns(filepath, columns, first_row):
+    import openpyxl
+    
+    wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        min_col, max_col = min(columns), max(columns)
+        data = {c: [] for c in columns}
+        for cells in ws.iter_rows(min_row=first_row + 1, min_col=min_col + 1, max_col=max_col + 1):
+            for c in columns:
+                pos = c - min_col
+                cell = cells[pos] if pos < len(cells) else None
+                if cell is None or cell.data_type == 'e':
+                    data[c].append(np.nan)
+                else:
+                    data[c].append(_excel_value(cell.value))
+    finally:
+        wb.close()
+    return pd.DataFrame(data, dtype=object)
+
+def _read_xls_columns(filepath, columns, first_row):
+    import xlrd
+    
+    book = xlrd.open_workbook(filepath, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        data = {c: [] for c in columns}
+        for r in range(first_row, sheet.nrows):
+            row_len = sheet.row_len(r)
+            for c in columns:
+                if c >= row_len:
+                    data[c].append(np.nan)
+                    continue
+                cell_type = sheet.cell_type(r, c)
+                value = sheet.cell_value(r, c)
+                if cell_type in (xlrd.XL_CELL_ERROR, xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+                    value = np.nan
+                elif cell_type == xlrd.XL_CELL_DATE:
+                    try:
+                        value = xlrd.xldate_as_datetime(value, book.datemode)
+                    except Exception:
+                        value = np.nan
+                elif cell_type == xlrd.XL_CELL_BOOLEAN:
+                    value = bool(value)
+                else:
+                    value = _excel_value(value)
+                data[c].append(value)
+    finally:
+        book.release_resources()
+    return pd.DataFrame(data, dtype=object)
+
+def _column_reader_errors(fmt):
+    if fmt == 'xlsx':
+        from openpyxl.utils.exceptions import InvalidFileException
+        return (zipfile.BadZipFile, InvalidFileException)
+    import xlrd
+    from xlrd.compdoc import CompDocError
+    return (xlrd.XLRDError, CompDocError)
+
+def read_excel_data_columns(filepath, columns, first_row):
+    columns = sorted(set(columns))
+    fmt = detect_file_format(filepath)
+    readers = {'xlsx': _read_xlsx_columns, 'xls': _read_xls_columns}
+    if fmt in readers:
+        try:
+            return readers[fmt](filepath, columns, first_row), None
+        except _column_reader_errors(fmt) as e:
+            metrics.count('columns_fallback')
+            print(f"{os.path.basename(filepath)}: столбцы не читаются напрямую ({type(e).__name__}: {e}), "
+                  f"файл читается целиком")
+        except Exception as e:
+            return None, {'file': os.path.basename(filepath), 'format': fmt, 'reason': f"{type(e).__name__}: {e}"}
+    return read_excel_checked(filepath, usecols=columns, skiprows=first_row, dtype=object)
 
 def extract_date_from_header(df_head):
     text_blob = " ".join(df_head.astype(str).sum().tolist()).lower()
@@ -68,15 +261,34 @@ def extract_date_from_header(df_head):
     
     return year, found_months[-1]
 
-def find_header_row_and_code_col(df):
-    for idx, row in df.head(40).iterrows():
-        row_str = row.astype(str).str.lower().tolist()
-        
-        has_code = any("код" in s for s in row_str)
-        has_tn = any("тн" in s and "вэд" in s for s in row_str)
-        has_name = any("наименование" in s for s in row_str)
-        
-        if (has_code and has_tn) or (has_code and has_name):
+WEIGHT_UNIT_RE = re.compile(r'\d\s*т$')
+WEIGHT_BAD_WORDS = ["долл", "usd", "руб", "стоим", "цена", "%", "темп", "рост", "млн"]
+MONTH_WORD_RE = re.compile(r'\b(?:январ|феврал|март|апрел|ма[йяе]|июн|июл|август|сентябр|октябр|ноябр|декабр)\w*')
+LAYOUT_CACHE_FILE = os.path.join(CACHE_DIR, 'layouts.json')
+
+def head_text_rows(df, n_rows):
+    return [[v.lower() for v in row] for row in df.head(n_rows).astype(str).to_numpy().tolist()]
+
+def is_header_row(row_str):
+    has_code = any("код" in s for s in row_str)
+    has_tn = any("тн" in s and "вэд" in s for s in row_str)
+    has_name = any("наименование" in s for s in row_str)
+    return (has_code and has_tn) or (has_code and has_name)
+
+def column_text(text_rows, c, header_row_idx):
+    return "".join(" " + text_rows[r][c] for r in range(header_row_idx, header_row_idx + 3)
+                   if r < len(text_rows) and text_rows[r][c] != 'nan')
+
+def is_weight_column(col_text):
+    has_thous = "тыс" in col_text
+    has_ton = "тонн" in col_text or " т." in col_text or " т " in col_text or WEIGHT_UNIT_RE.search(col_text)
+    has_bad = any(x in col_text for x in WEIGHT_BAD_WORDS)
+    return has_thous and has_ton and not has_bad
+
+def find_header_row_and_code_col(df, text_rows=None):
+    text_rows = text_rows or head_text_rows(df, HEADER_SCAN_ROWS)
+    for idx, row_str in enumerate(text_rows[:HEADER_SCAN_ROWS]):
+        if is_header_row(row_str):
             col_idx = -1
             for c_i, val in enumerate(row_str):
                 if "код" in val:
@@ -85,30 +297,93 @@ def find_header_row_and_code_col(df):
             return idx, col_idx
     return None, None
 
-def find_strict_thousand_tonnes_col(df, header_row_idx):
-    candidates = []
-    num_cols = df.shape[1]
-    rows_to_scan = [header_row_idx, header_row_idx + 1, header_row_idx + 2]
-    
-    for c in range(num_cols):
-        col_text = ""
-        for r in rows_to_scan:
-            if r < len(df):
-                val = str(df.iloc[r, c]).lower()
-                if val != 'nan':
-                    col_text += " " + val
-        
-        has_thous = "тыс" in col_text
-        has_ton = "тонн" in col_text or " т." in col_text or " т " in col_text or re.search(r'\d\s*т$', col_text)
-        has_bad = any(x in col_text for x in ["долл", "usd", "руб", "стоим", "цена", "%", "темп", "рост", "млн"])
-        
-        if has_thous and has_ton and not has_bad:
-            candidates.append(c)
-
+def find_strict_thousand_tonnes_col(df, header_row_idx, text_rows=None):
+    text_rows = text_rows or head_text_rows(df, header_row_idx + 3)
+    candidates = [c for c in range(df.shape[1]) if is_weight_column(column_text(text_rows, c, header_row_idx))]
     if not candidates:
         return None
     return candidates[-1]
 
+def layout_signature(text_rows, n_rows, n_cols):
+    parts = [f"{n_rows}x{n_cols}"]
+    for row in text_rows[:n_rows]:
+        parts.append("\x1f".join(MONTH_WORD_RE.sub('#', re.sub(r'\d+', '', v)) if v != 'nan' else '' for v in row))
+    return hashlib.md5("\x1e".join(parts).encode('utf-8')).hexdigest()[:16]
+
+def load_layout_cache(path=LAYOUT_CACHE_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Не читается кэш шаблонов {path}: {e}")
+        return {}
+    if data.get('parser_version') != PARSER_VERSION:
+        return {}
+    return data.get('layouts', {})
+
+def save_layout_cache(layouts, path=LAYOUT_CACHE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'parser_version': PARSER_VERSION, 'layouts': layouts}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def verify_layout(text_rows, layout, n_cols):
+    header_row_idx = layout['header_row']
+    if header_row_idx >= len(text_rows) or layout['weight_col'] >= n_cols:
+        return False
+    header = text_rows[header_row_idx]
+    if not is_header_row(header) or "код" not in header[layout['code_col']]:
+        return False
+    weight_cols = [c for c in range(layout['weight_col'], n_cols)
+                   if is_weight_column(column_text(text_rows, c, header_row_idx))]
+    return weight_cols == [layout['weight_col']]
+
+def detect_layout(df_head, layouts, stats=None):
+    started = time.perf_counter()
+    n_cols = df_head.shape[1]
+    row_counts = sorted({l['rows'] for l in layouts.values() if l['cols'] == n_cols})
+    scan_rows = HEADER_SCAN_ROWS + 2
+    text_rows = head_text_rows(df_head, min(row_counts[-1] + 2, scan_rows) if row_counts else scan_rows)
+    status = 'miss'
+    
+    for n_rows in row_counts:
+        if n_rows > len(text_rows):
+            break
+        layout = layouts.get(layout_signature(text_rows, n_rows, n_cols))
+        if layout is None:
+            continue
+        if verify_layout(text_rows, layout, n_cols):
+            elapsed = time.perf_counter() - started
+            metrics.count('layout_hit')
+            if stats is not None:
+                stats.update(layout='hit', detect_seconds=elapsed,
+                             saved_seconds=max(0.0, layout.get('detect_seconds', 0.0) - elapsed))
+            return layout['header_row'], layout['code_col'], layout['weight_col']
+        status = 'mismatch'
+    
+    if row_counts and row_counts[-1] + 2 < scan_rows:
+        text_rows = head_text_rows(df_head, scan_rows)
+    header_row_idx, code_col_idx = find_header_row_and_code_col(df_head, text_rows)
+    weight_col_idx = None
+    if header_row_idx is not None:
+        weight_col_idx = find_strict_thousand_tonnes_col(df_head, header_row_idx, text_rows)
+    elapsed = time.perf_counter() - started
+    
+    metrics.count(f'layout_{status}')
+    if stats is not None:
+        stats.update(layout=status, detect_seconds=elapsed, saved_seconds=0.0)
+    if header_row_idx is not None and weight_col_idx is not None:
+        signature = layout_signature(text_rows, header_row_idx + 1, n_cols)
+        layout = {'rows': header_row_idx + 1, 'cols': n_cols, 'header_row': header_row_idx,
+                  'code_col': code_col_idx, 'weight_col': weight_col_idx, 'detect_seconds': elapsed}
+        layouts[signature] = layout
+        if stats is not None:
+            stats['learned'] = (signature, layout)
+    return header_row_idx, code_col_idx, weight_col_idx
+
 def is_code_match(row_code_str, target_codes_list):
     raw = str(row_code_str).strip()
     if "(" in raw or "кроме" in raw.lower():
@@ -135,53 +410,94 @@ def is_code_match(row_code_str, target_codes_list):
             
     return False
 
-def process_customs_file(filepath, type_name):
+RANGE_CODE_RE = re.compile(r'^(\d{4})\s*-\s*(\d{4})$')
+
+def match_code(row_code_str, matcher):
+    raw = str(row_code_str).strip()
+    if "(" in raw or "кроме" in raw.lower():
+        return ()
+
+    range_match = RANGE_CODE_RE.match(raw)
+    if range_match:
+        return mapping.lookup_range(matcher, int(range_match.group(1)), int(range_match.group(2)))
+
+    clean_digits = "".join(filter(str.isdigit, raw))
+    if len(clean_digits) < 2:
+        return ()
+    return mapping.lookup_code(matcher, clean_digits)
+
+def match_code_column(codes, matcher):
+    codes = codes.astype(str).str.strip()
+    unique_codes = pd.unique(codes)
+    lookup = {c: match_code(c, matcher) for c in unique_codes}
+    return codes.map(lookup)
+
+def load_code_matcher(path=MAPPING_FILE):
+    path = os.path.abspath(path)
+    key = (path, tuple(inventory.file_stamp(path)))
+    if key not in CODE_MATCHERS:
+        entries = mapping.load_mapping(path)
+        if not entries:
+            raise ValueError(f"в справочнике {path} нет ни одного правила")
+        CODE_MATCHERS[key] = mapping.compile_registry(entries)
+    return CODE_MATCHERS[key]
+
+def parse_weight(val_cell):
+    try:
+        val_str = str(val_cell).replace('\xa0', '').replace(' ', '').replace(',', '.')
+        return float(val_str)
+    except:
+        return None
+
+def process_customs_file(filepath, type_name, matcher, layouts, errors=None, stats=None):
     filename = os.path.basename(filepath)
-    df_raw = read_excel_robust(filepath)
+    with metrics.stage('customs.decode'):
+        df_head, error = read_excel_head(filepath)
     
-    if df_raw is None:
-        print(f"ERROR: Не читается {filename}")
+    if df_head is None:
+        print(f"ERROR: Не читается {filename} ({error['format']}): {error['reason']}")
+        if errors is not None: errors.append(error)
         return []
 
-    year, month = extract_date_from_header(df_raw.head(20))
+    with metrics.stage('customs.header'):
+        year, month = extract_date_from_header(df_head.head(20))
+        header_row_idx, code_col_idx, weight_col_idx = detect_layout(df_head, layouts, stats) if year and month else (None, None, None)
     if not year or not month:
         print(f"SKIP {filename}: Нет даты.")
         return []
+    if stats is not None:
+        stats['period'] = (year, month)
 
-    header_res = find_header_row_and_code_col(df_raw)
-    if not header_res or header_res[0] is None:
+    if header_row_idx is None:
         print(f"SKIP {filename}: Нет колонки Код.")
         return []
-    
-    header_row_idx, code_col_idx = header_res
 
-    weight_col_idx = find_strict_thousand_tonnes_col(df_raw, header_row_idx)
-    
     if weight_col_idx is None:
         print(f"SKIP {filename}: Нет колонки 'тыс. тонн'.")
         return []
 
     results = []
-    start_data_idx = header_row_idx + 1
-    
-    for i in range(start_data_idx, len(df_raw)):
-        row = df_raw.iloc[i]
-        
-        code_cell = row[code_col_idx]
-        if pd.isna(code_cell): continue
-        code_str = str(code_cell).strip()
-        
-        val_cell = row[weight_col_idx]
-        try:
-            val_str = str(val_cell).replace('\xa0', '').replace(' ', '').replace(',', '.')
-            val_float = float(val_str)
-        except:
-            continue
+    with metrics.stage('customs.decode'):
+        data_rows, error = read_excel_data_columns(filepath, [code_col_idx, weight_col_idx], header_row_idx + 1)
+    if data_rows is None:
+        print(f"ERROR: Не читаются данные {filename} ({error['format']}): {error['reason']}")
+        if errors is not None: errors.append(error)
+        return results
+    codes = data_rows[code_col_idx]
+    codes = codes[codes.notna()]
+    metrics.count('rows_scanned', len(codes))
+    if codes.empty:
+        return results
 
-        if val_float <= 0: continue
+    with metrics.stage('customs.match'):
+        matches = match_code_column(codes, matcher)
+        matches = matches[matches.map(len) > 0]
+        weights = [parse_weight(v) for v in data_rows.loc[matches.index, weight_col_idx].tolist()]
+        
+        for prod_names, val_float in zip(matches, weights):
+            if val_float is None or val_float <= 0: continue
 
-        for prod_name, target_codes in BRIDGE_MAP.items():
-            if is_code_match(code_str, target_codes):
+            for prod_name in prod_names:
                 results.append({
                     'Year': year,
                     'Month': month,
@@ -189,9 +505,45 @@ def process_customs_file(filepath, type_name):
                     type_name: val_float
                 })
 
+    metrics.count('rows_matched', len(matches))
     return results
 
-def process_production_folder(folder_path):
+PRODUCTION_START = (2017, 1)
+PRODUCTION_END_YEAR = 2024
+PRODUCTION_EMPTY_CELLS = ['-', '', 'nan', 'None', '...']
+STREAM_YEARS = (PRODUCTION_START[0], PRODUCTION_END_YEAR)
+
+def match_production_name(prod_name_raw, products):
+    if prod_name_raw in products:
+        return prod_name_raw
+    compact = prod_name_raw.replace(" ", "")
+    for k in products:
+        if k.replace(" ", "") == compact or k in prod_name_raw:
+            return k
+    return None
+
+def detect_production_start(df, name_col_idx, start_row):
+    first_col = name_col_idx + 1
+    if first_col >= df.shape[1]:
+        return PRODUCTION_START
+    
+    label = df.columns[first_col]
+    if isinstance(label, (pd.Timestamp, datetime.date)):
+        return label.year, label.month
+    
+    cells = [label] + df.iloc[:start_row, first_col].tolist()
+    for cell in cells:
+        if isinstance(cell, (pd.Timestamp, datetime.date)):
+            return cell.year, cell.month
+    
+    text = " ".join(str(c) for c in cells if not pd.isna(c)).lower()
+    year_match = re.search(r'\b(20[0-9]{2})\b', text)
+    months = [MONTHS_RU[w] for w in re.sub(r'[^\w\s]', ' ', text).split() if w in MONTHS_RU]
+    if year_match and months:
+        return int(year_match.group(1)), months[0]
+    return PRODUCTION_START
+
+def process_production_folder(folder_path, products):
     files = glob.glob(os.path.join(folder_path, "*.xlsx"))
     if not files:
         print("Файл производства не найден.")
@@ -217,110 +569,520 @@ def process_production_folder(folder_path):
                     break
             break
             
-    df_data = df.iloc[start_row:].copy()
-    result_data = []
+    df_data = df.iloc[start_row:]
+    names = df_data.iloc[:, name_col_idx].astype(str).str.strip()
+    name_lookup = {name: match_production_name(name, products) for name in pd.unique(names)}
+    matched = names.map(name_lookup)
+    is_product = matched.notna().to_numpy()
+    if not is_product.any():
+        return pd.DataFrame()
+
+    start_year, start_month = detect_production_start(df, name_col_idx, start_row)
+    first_period = start_year * 12 + start_month - 1
+    n_periods = max(0, (PRODUCTION_END_YEAR + 1) * 12 - first_period)
     
-    start_year = 2017
-    start_month = 1
+    block = df_data.iloc[is_product, name_col_idx + 1:name_col_idx + 1 + n_periods]
+    n_rows, n_cols = block.shape
+    if n_cols == 0:
+        return pd.DataFrame()
+
+    cells = pd.Series(block.to_numpy(dtype=object).ravel())
+    cell_text = cells.astype(str).str.replace(',', '.', regex=False).str.replace('\xa0', '', regex=False).str.strip()
+    values = pd.to_numeric(cell_text.mask(cell_text.isin(PRODUCTION_EMPTY_CELLS)), errors='coerce')
+
+    periods = first_period + np.arange(n_cols)
+    return pd.DataFrame({
+        'Year': np.tile(periods // 12, n_rows),
+        'Month': np.tile(periods % 12 + 1, n_rows),
+        'Product': np.repeat(matched[is_product].to_numpy(), n_cols),
+        'Production': values.to_numpy(dtype=np.float64),
+    })
+
+
+def list_customs_files(folder_path):
+    files = [f for f in glob.glob(os.path.join(folder_path, "*.*")) if f.endswith(('.xls', '.xlsx'))]
+    return sorted(files)
+
+def file_digest(filepath):
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_path(digest, type_name, fingerprint):
+    return os.path.join(CACHE_DIR, f"{type_name.lower()}_{digest}_v{PARSER_VERSION}_{fingerprint[:8]}.npz")
+
+def records_arrays(records, type_name):
+    products = list(dict.fromkeys(r['Product'] for r in records))
+    product_idx = {name: i for i, name in enumerate(products)}
+    return {
+        'year': np.array([r['Year'] for r in records], dtype=np.int16),
+        'month': np.array([r['Month'] for r in records], dtype=np.int8),
+        'product': np.array([product_idx[r['Product']] for r in records], dtype=np.int16),
+        'value': np.array([r[type_name] for r in records], dtype=np.float64),
+        'products': np.array(products, dtype=str),
+    }
+
+def arrays_records(arrays, type_name):
+    products = arrays['products'].tolist()
+    return [
+        {'Year': int(y), 'Month': int(m), 'Product': products[p], type_name: float(v)}
+        for y, m, p, v in zip(arrays['year'], arrays['month'], arrays['product'], arrays['value'])
+    ]
+
+def save_cached_records(path, arrays):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+def load_cached_arrays(path):
+    with np.load(path) as npz:
+        return {name: npz[name] for name in npz.files}
+
+def load_cached_records(path, type_name):
+    return arrays_records(load_cached_arrays(path), type_name)
+
+def _timed_process_customs_file(task):
+    metrics.set_enabled(task[5])
+    with metrics.collect() as collector:
+        out = _process_customs_task(task)
+    out['metrics'] = collector.state()
+    return out
+
+def _process_customs_task(task):
+    filepath, type_name, mapping_path, layouts, use_cache, _, stream = task
+    matcher = load_code_matcher(mapping_path)
+    started = time.perf_counter()
+    digest = None
+    cache_status = None
+    res = None
+    arrays = None
     
-    for _, row in df_data.iterrows():
-        prod_name_raw = str(row.iloc[name_col_idx]).strip()
-        matched_key = None
-        
-        if prod_name_raw in BRIDGE_MAP:
-            matched_key = prod_name_raw
-        else:
-            for k in BRIDGE_MAP.keys():
-                if k.replace(" ", "") == prod_name_raw.replace(" ", ""):
-                    matched_key = k
-                    break
-                if k in prod_name_raw:
-                    matched_key = k
-                    break
-        
-        if not matched_key:
-            continue
-            
-        current_y = start_year
-        current_m = start_month
-        data_cols = row.iloc[name_col_idx+1:]
-        
-        for val in data_cols:
-            if current_y > 2024: break
+    if use_cache:
+        digest = file_digest(filepath)
+        cached = cache_path(digest, type_name, matcher['fingerprint'])
+        if os.path.exists(cached):
             try:
-                val_str = str(val).replace(',', '.').replace('\xa0', '').strip()
-                if val_str in ['-', '', 'nan', 'None', '...']:
-                    val_float = None
-                else:
-                    val_float = float(val_str)
-            except:
-                val_float = None
-                
-            result_data.append({
-                'Year': current_y,
-                'Month': current_m,
-                'Product': matched_key,
-                'Production': val_float
-            })
-            
-            current_m += 1
-            if current_m > 12:
-                current_m = 1
-                current_y += 1
-                
-    return pd.DataFrame(result_data)
+                arrays = load_cached_arrays(cached)
+                cache_status = 'hit'
+            except Exception as e:
+                print(f"Кэш повреждён {os.path.basename(cached)}: {e}")
+
+    errors = []
+    layout_stats = {}
+    if arrays is None:
+        res = process_customs_file(filepath, type_name, matcher, layouts, errors, layout_stats)
+        if use_cache or stream:
+            arrays = records_arrays(res, type_name)
+        if use_cache:
+            cache_status = 'miss'
+            if not errors:
+                save_cached_records(cached, arrays)
+    elif not stream:
+        res = arrays_records(arrays, type_name)
+
+    period = layout_stats.pop('period', None)
+    if period is None and arrays is not None and len(arrays['year']):
+        period = (int(arrays['year'][0]), int(arrays['month'][0]))
+
+    n_records = len(arrays['value']) if stream else len(res)
+    elapsed = time.perf_counter() - started
+    metrics.count('files')
+    metrics.count('records', n_records)
+    if cache_status:
+        metrics.count(f"cache_{cache_status}")
+
+    return {
+        'file': filepath,
+        'records': None if stream else res,
+        'arrays': arrays if stream else None,
+        'n_records': n_records,
+        'period': period,
+        'seconds': elapsed,
+        'cache': cache_status,
+        'digest': digest,
+        'errors': errors,
+        'layout': layout_stats,
+    }
+
+def collect_customs_outputs(files, type_name, workers=1, use_cache=True, stats=None, accumulator=None,
+                            mapping_path=MAPPING_FILE, executor=None, layouts=None):
+    mapping_path = os.path.abspath(mapping_path)
+    layouts = {} if layouts is None else layouts
+    tasks = [(f, type_name, mapping_path, layouts, use_cache, metrics.ENABLED, accumulator is not None) for f in files]
+    
+    own_executor = None
+    if executor is None and workers > 1 and len(tasks) > 1:
+        executor = own_executor = ProcessPoolExecutor(max_workers=min(workers, len(tasks)))
+    outputs = []
+    try:
+        if executor is not None and len(tasks) > 1:
+            results = executor.map(_timed_process_customs_file, tasks)
+        else:
+            results = map(_timed_process_customs_file, tasks)
+        for out in results:
+            outputs.append(reduce_output(out, type_name, accumulator))
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown()
 
+    total_time = 0.0
+    for out in outputs:
+        total_time += out['seconds']
+        cache_note = f", кэш: {out['cache']}" if out['cache'] else ""
+        print(f"{type_name} {os.path.basename(out['file'])}: {out['seconds']:.2f} с, записей {out['n_records']}{cache_note}")
+        if stats is not None and out['cache']:
+            stats[out['cache']] = stats.get(out['cache'], 0) + 1
+        metrics.merge(out['metrics'])
+        metrics.emit('file', flow=type_name, file=out['file'], seconds=round(out['seconds'], 4),
+                     cache=out['cache'], **out['metrics']['counters'])
 
-def main():
+    if outputs:
+        print(f"{type_name}: файлов {len(outputs)}, суммарное время разбора {total_time:.2f} с")
     
-    df_prod = process_production_folder(os.path.join(BASE_DIR, 'production'))
+    layout_stats = [out['layout'] for out in outputs if out['layout'].get('layout')]
+    for out in layout_stats:
+        if 'learned' in out:
+            layouts.setdefault(*out['learned'])
+    if layout_stats:
+        hits = sum(1 for l in layout_stats if l['layout'] == 'hit')
+        mismatches = sum(1 for l in layout_stats if l['layout'] == 'mismatch')
+        detect_time = sum(l['detect_seconds'] for l in layout_stats)
+        saved = sum(l['saved_seconds'] for l in layout_stats)
+        print(f"{type_name}: шаблон заголовка узнан в {hits} из {len(layout_stats)} файлов ({hits / len(layout_stats):.0%}), "
+              f"не прошёл проверку {mismatches}, поиск заголовков {detect_time:.3f} с, сэкономлено {saved:.3f} с")
     
-    imp_data = []
-    imp_files = [f for f in glob.glob(os.path.join(BASE_DIR, 'import', "*.*")) if f.endswith(('.xls', '.xlsx'))]
-    for f in imp_files:
-        res = process_customs_file(f, 'Import')
-        if res: imp_data.extend(res)
-            
-    df_imp = pd.DataFrame(imp_data)
-    if not df_imp.empty:
-        df_imp = df_imp.groupby(['Year', 'Month', 'Product'], as_index=False)['Import'].sum()
+    errors = [e for out in outputs for e in out['errors']]
+    if errors:
+        print(f"{type_name}: не прочитано файлов {len(errors)}")
+        for e in errors:
+            print(f"  - {e['file']} ({e['format']}): {e['reason']}")
+    return outputs
 
-    exp_data = []
-    exp_files = [f for f in glob.glob(os.path.join(BASE_DIR, 'export', "*.*")) if f.endswith(('.xls', '.xlsx'))]
-    for f in exp_files:
-        res = process_customs_file(f, 'Export')
-        if res: exp_data.extend(res)
+def reduce_output(out, type_name, accumulator):
+    if accumulator is not None:
+        accumulate_arrays(accumulator, type_name, out['arrays'])
+        out['arrays'] = None
+    return out
 
-    df_exp = pd.DataFrame(exp_data)
-    if not df_exp.empty:
-        df_exp = df_exp.groupby(['Year', 'Month', 'Product'], as_index=False)['Export'].sum()
+def new_accumulator(products, years=None):
+    first_year, last_year = years or STREAM_YEARS
+    shape = (last_year - first_year + 1, 12, len(products))
+    return {
+        'first_year': first_year,
+        'shape': shape,
+        'products': list(products),
+        'index': {name: i for i, name in enumerate(products)},
+        'sum': {flow: np.zeros(shape, dtype=np.float64) for flow in FLOWS},
+        'count': {flow: np.zeros(shape, dtype=np.int32) for flow in FLOWS},
+        'rows': {flow: np.zeros(shape, dtype=np.int32) for flow in FLOWS},
+    }
 
-    dfs = [d for d in [df_prod, df_imp, df_exp] if not d.empty]
+def accumulate(acc, flow, years, months, product_pos, values):
+    year_pos = np.asarray(years, dtype=np.int64) - acc['first_year']
+    month_pos = np.asarray(months, dtype=np.int64) - 1
+    product_pos = np.asarray(product_pos, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
     
-    if not dfs:
-        print("Данные не найдены.")
+    keep = (year_pos >= 0) & (year_pos < acc['shape'][0]) & (product_pos >= 0)
+    pos = (year_pos[keep], month_pos[keep], product_pos[keep])
+    values = values[keep]
+    has_value = ~np.isnan(values)
+    
+    valued = tuple(p[has_value] for p in pos)
+    np.add.at(acc['rows'][flow], pos, 1)
+    np.add.at(acc['count'][flow], valued, 1)
+    np.add.at(acc['sum'][flow], valued, values[has_value])
+
+def accumulate_arrays(acc, flow, arrays):
+    if not len(arrays['value']):
         return
+    remap = np.array([acc['index'].get(p, -1) for p in arrays['products'].tolist()], dtype=np.int64)
+    accumulate(acc, flow, arrays['year'], arrays['month'], remap[arrays['product']], arrays['value'])
 
-    df_final = dfs[0]
-    for df_next in dfs[1:]:
-        df_final = pd.merge(df_final, df_next, on=['Year', 'Month', 'Product'], how='outer')
+def accumulate_frame(acc, flow, df):
+    if df.empty:
+        return
+    product_pos = pd.Categorical(df['Product'], categories=acc['products']).codes
+    accumulate(acc, flow, df['Year'].to_numpy(), df['Month'].to_numpy(), product_pos,
+               pd.to_numeric(df[flow], errors='coerce').to_numpy(dtype=np.float64))
 
-    if 'Production' not in df_final.columns: df_final['Production'] = None
-    if 'Import' not in df_final.columns: df_final['Import'] = None
-    if 'Export' not in df_final.columns: df_final['Export'] = None
+def accumulator_table(acc):
+    present = np.zeros(acc['shape'], dtype=bool)
+    for flow in FLOWS:
+        present |= acc['rows'][flow] > 0
+    year_pos, month_pos, product_pos = np.nonzero(present)
+    if not len(year_pos):
+        return None
+
+    cleaned = np.array([clean_product_name(p) for p in acc['products']], dtype=object)
+    df_final = pd.DataFrame({
+        'Year': (year_pos + acc['first_year']).astype(np.int16),
+        'Month': (month_pos + 1).astype(np.int8),
+        'Product': pd.Categorical(cleaned[product_pos]),
+    })
+    for flow in FLOWS:
+        filled = acc['count' if flow in FLOWS_KEEP_NAN else 'rows'][flow][present] > 0
+        df_final[flow] = np.where(filled, acc['sum'][flow][present], np.nan)
     
     df_final['Demand'] = df_final['Production'] + df_final['Import'] - df_final['Export']
+    df_final = df_final.sort_values(by=['Product', 'Year', 'Month'])
+    
+    cols = ['Year', 'Month', 'Product', 'Production', 'Import', 'Export', 'Demand']
+    return df_final[cols]
 
-    df_final['Product'] = df_final['Product'].apply(clean_product_name)
+def flatten_records(outputs, keys=None):
+    data = []
+    for out in outputs:
+        for r in out['records']:
+            if keys is None or (r['Year'], r['Month'], r['Product']) in keys:
+                data.append(r)
+    return data
+
+def records_frame(data):
+    return pd.DataFrame(data)
+
+def flow_totals(df, flow, products):
+    year = df['Year'].to_numpy(dtype=np.int64)
+    in_range = (year >= 2017) & (year <= 2024)
+    month = df['Month'].to_numpy(dtype=np.int64)[in_range]
+    product = pd.Categorical(df['Product'], categories=products).codes[in_range]
+    key = (year[in_range] * 12 + month - 1) * len(products) + product
+    values = pd.to_numeric(df[flow], errors='coerce').to_numpy(dtype=np.float64)[in_range]
+
+    totals = pd.Series(values).groupby(key).agg(['sum', 'count'])
+    if flow in FLOWS_KEEP_NAN:
+        totals.loc[totals['count'].to_numpy() == 0, 'sum'] = np.nan
+    return totals.index.to_numpy(), totals['sum'].to_numpy()
+
+def build_final_table(df_prod, df_imp, df_exp):
+    flows = [(flow, df) for flow, df in zip(FLOWS, [df_prod, df_imp, df_exp]) if not df.empty]
+    
+    if not flows:
+        return None
+
+    products = pd.Index(np.concatenate([pd.unique(df['Product']) for _, df in flows])).unique()
+    totals = {flow: flow_totals(df, flow, products) for flow, df in flows}
+    keys = np.unique(np.concatenate([k for k, _ in totals.values()]))
+
+    period, product = np.divmod(keys, len(products))
+    df_final = pd.DataFrame({
+        'Year': (period // 12).astype(np.int16),
+        'Month': (period % 12 + 1).astype(np.int8),
+        'Product': pd.Categorical.from_codes(product, categories=products),
+    })
+    for flow in FLOWS:
+        column = np.full(len(keys), np.nan)
+        if flow in totals:
+            flow_keys, sums = totals[flow]
+            column[np.searchsorted(keys, flow_keys)] = sums
+        df_final[flow] = column
+    
+    df_final['Demand'] = df_final['Production'] + df_final['Import'] - df_final['Export']
+
+    products = df_final['Product'].cat
+    cleaned = np.array([clean_product_name(c) for c in products.categories], dtype=object)
+    df_final['Product'] = pd.Categorical(cleaned[products.codes])
 
-    df_final = df_final[df_final['Year'].between(2017, 2024)]
     df_final = df_final.sort_values(by=['Product', 'Year', 'Month'])
     
     cols = ['Year', 'Month', 'Product', 'Production', 'Import', 'Export', 'Demand']
-    df_final = df_final[cols]
+    return df_final[cols]
+
+def production_digests(folder_path):
+    return {f: file_digest(f) for f in sorted(glob.glob(os.path.join(folder_path, "*.xlsx")))}
+
+def load_inputs_manifest():
+    if not os.path.exists(INPUTS_MANIFEST):
+        return None
+    try:
+        with open(INPUTS_MANIFEST, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Не читается манифест входных файлов: {e}")
+        return None
+
+def manifest_entry(out):
+    if not out['errors']:
+        return {'digest': out['digest'], 'status': 'ok'}
+    return {'digest': out['digest'], 'status': 'error', 'reason': '; '.join(e['reason'] for e in out['errors'])}
+
+def save_inputs_manifest(prod_digests, imp_outputs, exp_outputs, fingerprint):
+    manifest = {
+        'parser_version': PARSER_VERSION,
+        'mapping': fingerprint,
+        'production': prod_digests,
+        'Import': {out['file']: manifest_entry(out) for out in imp_outputs},
+        'Export': {out['file']: manifest_entry(out) for out in exp_outputs},
+    }
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = INPUTS_MANIFEST + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, INPUTS_MANIFEST)
+
+def changed_keys(outputs, previous, type_name, fingerprint):
+    keys = set()
+    current = {out['file']: out['digest'] for out in outputs}
+    
+    for out in outputs:
+        if previous.get(out['file'], {}).get('digest') != out['digest']:
+            keys.update((r['Year'], r['Month'], r['Product']) for r in out['records'])
+
+    for filepath, entry in previous.items():
+        if current.get(filepath) == entry['digest'] or entry['status'] == 'error':
+            continue
+        old_cached = cache_path(entry['digest'], type_name, fingerprint)
+        if not os.path.exists(old_cached):
+            return None
+        keys.update((r['Year'], r['Month'], r['Product']) for r in load_cached_records(old_cached, type_name))
+    
+    return keys
+
+def upsert_final_table(df_existing, df_updated, keys):
+    clean_keys = {(y, m, clean_product_name(p)) for y, m, p in keys}
+    existing_keys = pd.Series(list(zip(df_existing['Year'], df_existing['Month'], df_existing['Product'])), index=df_existing.index)
+    df_kept = df_existing[~existing_keys.isin(clean_keys)]
+    
+    parts = [d for d in [df_kept, df_updated] if d is not None and not d.empty]
+    if not parts:
+        return df_existing.iloc[0:0]
+    df_final = pd.concat(parts, ignore_index=True)
+    return df_final.sort_values(by=['Product', 'Year', 'Month'])
+
+
+def write_final_table(df_final, formats):
+    return outputs.write_table(df_final, OUTPUT_BASE, formats, outputs.DEMAND_DTYPES, outputs.DEMAND_PARTITIONS)
+
+
+def main(workers=1, use_cache=True, incremental=False, formats=('xlsx',), stream=False, mapping_path=MAPPING_FILE,
+         executor=None):
+    try:
+        matcher = load_code_matcher(mapping_path)
+    except (OSError, ValueError) as e:
+        print(f"Не загружен справочник кодов {mapping_path}: {e}")
+        return
+    fingerprint = matcher['fingerprint']
+    layouts = load_layout_cache() if use_cache else {}
+    cache_stats = {'hit': 0, 'miss': 0}
+    prod_folder = os.path.join(BASE_DIR, 'production')
+    existing_output = outputs.find_existing_output(OUTPUT_BASE, formats)
+    
+    manifest = None
+    if incremental:
+        if stream:
+            print("Потоковый режим пересобирает таблицу целиком, --incremental не используется.")
+        elif not use_cache:
+            print("Инкрементальный режим требует кэша, выполняется полная пересборка.")
+        elif existing_output is None:
+            print(f"Нет {OUTPUT_BASE} в форматах {', '.join(formats)}, выполняется полная пересборка.")
+        else:
+            manifest = load_inputs_manifest()
+            if (manifest is None or manifest.get('parser_version') != PARSER_VERSION
+                    or manifest.get('mapping') != fingerprint):
+                print("Манифест входных файлов устарел, выполняется полная пересборка.")
+                manifest = None
+
+    prod_digests = production_digests(prod_folder) if use_cache else {}
+    if manifest is not None and manifest.get('production') != prod_digests:
+        print("Изменился файл производства, выполняется полная пересборка.")
+        manifest = None
+
+    accumulator = new_accumulator(matcher['products']) if stream else None
+    imp_files = list_customs_files(os.path.join(BASE_DIR, 'import'))
+    with metrics.stage('customs.import'):
+        imp_outputs = collect_customs_outputs(imp_files, 'Import', workers, use_cache, cache_stats, accumulator,
+                                              mapping_path, executor, layouts)
+
+    exp_files = list_customs_files(os.path.join(BASE_DIR, 'export'))
+    with metrics.stage('customs.export'):
+        exp_outputs = collect_customs_outputs(exp_files, 'Export', workers, use_cache, cache_stats, accumulator,
+                                              mapping_path, executor, layouts)
+
+    keys = None
+    if manifest is not None:
+        imp_keys = changed_keys(imp_outputs, manifest.get('Import', {}), 'Import', fingerprint)
+        exp_keys = changed_keys(exp_outputs, manifest.get('Export', {}), 'Export', fingerprint)
+        if imp_keys is None or exp_keys is None:
+            print("Нет кэша для изменившихся файлов, выполняется полная пересборка.")
+        else:
+            keys = imp_keys | exp_keys
+
+    if keys is not None:
+        print(f"Инкрементальное обновление: затронуто строк {len(keys)}")
+        df_existing = outputs.read_table(existing_output)
+        if keys:
+            with metrics.stage('production'):
+                df_prod = process_production_folder(prod_folder, matcher['products'])
+            if not df_prod.empty:
+                prod_keys = pd.Series(list(zip(df_prod['Year'], df_prod['Month'], df_prod['Product'])), index=df_prod.index)
+                df_prod = df_prod[prod_keys.isin(keys)]
+            with metrics.stage('merge'):
+                df_imp = records_frame(flatten_records(imp_outputs, keys))
+                df_exp = records_frame(flatten_records(exp_outputs, keys))
+                df_final = upsert_final_table(df_existing, build_final_table(df_prod, df_imp, df_exp), keys)
+            with metrics.stage('write'):
+                written = write_final_table(df_final, formats)
+        else:
+            written = [existing_output]
+    else:
+        with metrics.stage('production'):
+            df_prod = process_production_folder(prod_folder, matcher['products'])
+        with metrics.stage('merge'):
+            if accumulator is not None:
+                accumulate_frame(accumulator, 'Production', df_prod)
+                df_final = accumulator_table(accumulator)
+            else:
+                df_imp = records_frame(flatten_records(imp_outputs))
+                df_exp = records_frame(flatten_records(exp_outputs))
+                df_final = build_final_table(df_prod, df_imp, df_exp)
+        if df_final is None:
+            print("Данные не найдены.")
+            metrics.report('process_data')
+            return
+
+        with metrics.stage('write'):
+            written = write_final_table(df_final, formats)
+        metrics.count('rows_written', len(df_final))
+
+    if use_cache:
+        save_inputs_manifest(prod_digests, imp_outputs, exp_outputs, fingerprint)
+        inventory.update_period_index({
+            'import': {out['file']: out['period'] for out in imp_outputs},
+            'export': {out['file']: out['period'] for out in exp_outputs},
+        })
+        save_layout_cache(layouts)
+        print(f"Кэш разбора: попаданий {cache_stats['hit']}, промахов {cache_stats['miss']}")
+    metrics.report('process_data')
+    print(f"Готово! Результат: {', '.join(written)}")
+
+def run_cli(argv=None):
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--workers', type=int, default=WORKERS,
+                            help='число процессов для разбора таможенных файлов (1 - последовательно)')
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help='не использовать кэш разобранных файлов')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='пересчитать только строки, затронутые новыми или изменёнными файлами')
+    arg_parser.add_argument('--format', nargs='+', choices=outputs.OUTPUT_FORMATS, default=['xlsx'],
+                            help='форматы итоговой таблицы')
+    arg_parser.add_argument('--mapping', default=MAPPING_FILE,
+                            help='справочник соответствия товаров и кодов ТН ВЭД (CSV или YAML)')
+    arg_parser.add_argument('--stream', action='store_true',
+                            help='сводить файлы сразу в массивы год × месяц × товар, не храня записи в памяти')
+    arg_parser.add_argument('--metrics', nargs='?', const='-', metavar='PATH',
+                            help='писать время этапов и счётчики в JSON-лог (без пути - в stderr)')
+    arg_parser.add_argument('--profile', metavar='DIR',
+                            help='сохранить cProfile каждого этапа в папку')
+    args = arg_parser.parse_args(argv)
+    if args.metrics or args.profile:
+        metrics.configure(args.metrics, args.profile)
+    main(workers=max(1, args.workers), use_cache=not args.no_cache, incremental=args.incremental,
+         formats=args.format, stream=args.stream, mapping_path=args.mapping)
 
-    df_final.to_excel(OUTPUT_FILE, index=False)
-    print(f"Готово! Результат: {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    main()
+    run_cli()
@@ -0,0 +1,93 @@
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import outputs
+
+DEMAND_BASE = 'final_demand_metallurgy_clean'
+SHARES_BASE = 'electricity_consumption_2017-2024_percent'
+RES_BASE = os.path.join('data', 'processed', 'res')
+REGION_COL = 'Регион'
+
+REGIONAL_DTYPES = {
+    'Year': 'int16',
+    'Month': 'int8',
+    'Product': 'category',
+    'Region': 'category',
+    'Share': 'float64',
+    'Demand': 'float64',
+}
+
+
+def share_matrix(df_shares):
+    year_cols = sorted(c for c in df_shares.columns if str(c).isdigit())
+    if not year_cols:
+        raise ValueError(f"в таблице долей нет столбцов с годами: {', '.join(map(str, df_shares.columns))}")
+    years = np.array([int(c) for c in year_cols])
+    shares = df_shares[year_cols].to_numpy(dtype=np.float64) / 100
+    regions = df_shares[REGION_COL].astype(str).to_numpy()
+    return regions, years, shares
+
+
+def allocate_demand(df_demand, df_shares, value_col='Demand'):
+    regions, years, shares = share_matrix(df_shares)
+
+    year_pos = np.searchsorted(years, df_demand['Year'].to_numpy())
+    year_pos = np.clip(year_pos, 0, len(years) - 1)
+    known = years[year_pos] == df_demand['Year'].to_numpy()
+    df_demand = df_demand[known]
+    year_pos = year_pos[known]
+
+    n_rows, n_regions = len(df_demand), len(regions)
+    row_shares = shares[:, year_pos].T
+    values = df_demand[value_col].to_numpy(dtype=np.float64)
+    allocated = values[:, None] * row_shares
+
+    return pd.DataFrame({
+        'Year': np.repeat(df_demand['Year'].to_numpy(), n_regions),
+        'Month': np.repeat(df_demand['Month'].to_numpy(), n_regions),
+        'Product': np.repeat(df_demand['Product'].astype(str).to_numpy(), n_regions),
+        'Region': np.tile(regions, n_rows),
+        'Share': (row_shares * 100).ravel(),
+        'Demand': allocated.ravel(),
+    })
+
+
+def main(demand_path=None, shares_path=None, formats=('xlsx',)):
+    demand_path = demand_path or outputs.find_existing_output(DEMAND_BASE)
+    shares_path = shares_path or outputs.find_existing_output(SHARES_BASE)
+    if not demand_path or not os.path.exists(demand_path):
+        print(f"Не найдена таблица спроса {DEMAND_BASE}")
+        return None
+    if not shares_path or not os.path.exists(shares_path):
+        print(f"Не найдены региональные доли {SHARES_BASE}")
+        return None
+
+    df_demand = outputs.read_table(demand_path)
+    df_shares = outputs.read_table(shares_path)
+
+    try:
+        df_res = allocate_demand(df_demand, df_shares)
+    except ValueError as e:
+        print(f"Не распределяется спрос по {shares_path}: {e}")
+        return None
+    os.makedirs(os.path.dirname(RES_BASE), exist_ok=True)
+    written = outputs.write_table(df_res, RES_BASE, formats, REGIONAL_DTYPES)
+    print(f"Регионов {df_shares.shape[0]}, строк {len(df_res)}. Результат: {', '.join(written)}")
+    return written
+
+
+def run_cli(argv=None):
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--demand', help='таблица спроса по России (по умолчанию результат process_data)')
+    arg_parser.add_argument('--shares', help='доли регионов по годам (по умолчанию результат parser)')
+    arg_parser.add_argument('--format', nargs='+', choices=outputs.OUTPUT_FORMATS, default=['xlsx'],
+                            help='форматы res')
+    args = arg_parser.parse_args(argv)
+    main(args.demand, args.shares, args.format)
+
+
+if __name__ == "__main__":
+    run_cli()
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import hashlib
+import shutil
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+import outputs
+import regional
+
+ROLLUP_DIR = os.path.join('data', 'cache', 'rollups')
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8050
+CHECK_INTERVAL = 1.0
+FLOW_COLS = ['Production', 'Import', 'Export', 'Demand']
+
+
+def source_paths():
+    return {
+        'demand': outputs.find_existing_output(regional.DEMAND_BASE),
+        'res': outputs.find_existing_output(regional.RES_BASE),
+        'shares': outputs.find_existing_output(regional.SHARES_BASE),
+    }
+
+
+def source_fingerprint(paths):
+    result = {}
+    for name, path in paths.items():
+        if path and os.path.exists(path):
+            st = os.stat(path)
+            result[name] = [path, st.st_size, st.st_mtime_ns]
+        else:
+            result[name] = None
+    return result
+
+
+def load_regional(paths, df_demand):
+    if paths['res']:
+        return outputs.read_table(paths['res'], dtypes=regional.REGIONAL_DTYPES)
+    if paths['shares']:
+        return regional.allocate_demand(df_demand, outputs.read_table(paths['shares']))
+    return pd.DataFrame(columns=['Year', 'Month', 'Product', 'Region', 'Demand'])
+
+
+def cube(index_arrays, shape, values):
+    flat = np.ravel_multi_index(index_arrays, shape)
+    size = int(np.prod(shape))
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    if values.ndim == 1:
+        return np.bincount(flat, weights=values, minlength=size).reshape(shape)
+    return np.stack([np.bincount(flat, weights=values[:, i], minlength=size) for i in range(values.shape[1])],
+                    axis=-1).reshape(shape + (values.shape[1],))
+
+
+def build_rollups(df_demand, df_res):
+    products = sorted(set(df_demand['Product'].astype(str)) | set(df_res['Product'].astype(str)))
+    regions = sorted(set(df_res['Region'].astype(str)))
+    all_years = np.concatenate([df_demand['Year'].to_numpy(dtype=np.int64), df_res['Year'].to_numpy(dtype=np.int64)])
+    years = list(range(int(all_years.min()), int(all_years.max()) + 1)) if len(all_years) else []
+    first_year = years[0] if years else 0
+    n_p, n_r, n_y = len(products), len(regions), len(years)
+
+    d_product = pd.Categorical(df_demand['Product'].astype(str), categories=products).codes
+    d_year = df_demand['Year'].to_numpy(dtype=np.int64) - first_year
+    d_month = df_demand['Month'].to_numpy(dtype=np.int64) - 1
+
+    r_product = pd.Categorical(df_res['Product'].astype(str), categories=products).codes
+    r_region = pd.Categorical(df_res['Region'].astype(str), categories=regions).codes
+    r_year = df_res['Year'].to_numpy(dtype=np.int64) - first_year
+    r_quarter = r_year * 4 + (df_res['Month'].to_numpy(dtype=np.int64) - 1) // 3
+    r_demand = df_res['Demand'].to_numpy(dtype=np.float64)
+
+    flows = df_demand[FLOW_COLS].to_numpy(dtype=np.float64)
+    arrays = {
+        'product_year': cube((d_product, d_year), (n_p, n_y), flows),
+        'product_month': cube((d_product, d_year * 12 + d_month), (n_p, n_y * 12), flows),
+        'region_year': cube((r_region, r_year), (n_r, n_y), r_demand),
+        'product_region_quarter': cube((r_product, r_region, r_quarter), (n_p, n_r, n_y * 4), r_demand),
+    }
+    axes = {'products': products, 'regions': regions, 'years': years}
+    return arrays, axes
+
+
+def save_rollups(arrays, axes, fingerprint, folder):
+    key = hashlib.md5(json.dumps(fingerprint, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    target = os.path.join(folder, key)
+    tmp_target = target + '.tmp'
+    if os.path.isdir(tmp_target):
+        shutil.rmtree(tmp_target)
+    os.makedirs(tmp_target)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_target, name + '.npy'), arr)
+    with open(os.path.join(tmp_target, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'axes': axes, 'fingerprint': fingerprint}, f, ensure_ascii=False)
+    if os.path.isdir(target):
+        shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_target, target)
+
+    pointer = os.path.join(folder, 'current.json')
+    with open(pointer + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'key': key}, f)
+    os.replace(pointer + '.tmp', pointer)
+
+    for name in os.listdir(folder):
+        old = os.path.join(folder, name)
+        if name != key and os.path.isdir(old):
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def load_rollups(folder):
+    pointer = os.path.join(folder, 'current.json')
+    if not os.path.exists(pointer):
+        return None, None, None
+    with open(pointer, 'r', encoding='utf-8') as f:
+        target = os.path.join(folder, json.load(f)['key'])
+    with open(os.path.join(target, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in os.listdir(target):
+        if name.endswith('.npy'):
+            arrays[name[:-4]] = np.load(os.path.join(target, name), mmap_mode='r')
+    return arrays, meta['axes'], meta['fingerprint']
+
+
+class RollupStore:
+    def __init__(self, paths_func=source_paths, folder=ROLLUP_DIR, check_interval=CHECK_INTERVAL):
+        self.paths_func = paths_func
+        self.folder = folder
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.checked = 0.0
+        self.fingerprint = None
+        self.data = None
+        self.builds = 0
+
+    def refresh(self, force=False):
+        paths = self.paths_func()
+        fingerprint = source_fingerprint(paths)
+        if not force and fingerprint == self.fingerprint and self.data is not None:
+            return False
+
+        if not force:
+            arrays, axes, stored = load_rollups(self.folder)
+            if stored == fingerprint:
+                self.data, self.fingerprint = (arrays, axes), fingerprint
+                return True
+
+        if not paths['demand']:
+            raise FileNotFoundError(f"Не найдена таблица спроса {regional.DEMAND_BASE}")
+        started = time.perf_counter()
+        df_demand = outputs.read_table(paths['demand'], dtypes=outputs.DEMAND_DTYPES)
+        arrays, axes = build_rollups(df_demand, load_regional(paths, df_demand))
+        save_rollups(arrays, axes, fingerprint, self.folder)
+        arrays, axes, _ = load_rollups(self.folder)
+        self.data, self.fingerprint = (arrays, axes), fingerprint
+        self.builds += 1
+        print(f"Агрегаты пересчитаны за {time.perf_counter() - started:.2f} с: товаров {len(axes['products'])}, "
+              f"регионов {len(axes['regions'])}, лет {len(axes['years'])}")
+        return True
+
+    def current(self):
+        now = time.monotonic()
+        if self.data is None or now - self.checked >= self.check_interval:
+            with self.lock:
+                if self.data is None or now - self.checked >= self.check_interval:
+                    self.refresh()
+                    self.checked = now
+        return self.data
+
+
+def axis_positions(labels, selected):
+    if not selected:
+        return np.arange(len(labels))
+    lookup = {label: i for i, label in enumerate(labels)}
+    return np.array([lookup[s] for s in selected if s in lookup], dtype=np.int64)
+
+
+def year_positions(years, params):
+    if not years:
+        return np.arange(0)
+    lo = int(params.get('year_from', [years[0]])[0])
+    hi = int(params.get('year_to', [years[-1]])[0])
+    return np.arange(max(lo, years[0]) - years[0], min(hi, years[-1]) - years[0] + 1)
+
+
+def query_product_year(arrays, axes, params):
+    p_pos = axis_positions(axes['products'], params.get('product'))
+    y_pos = year_positions(axes['years'], params)
+    block = arrays['product_year'][np.ix_(p_pos, y_pos)]
+    return [
+        {'Product': axes['products'][p], 'Year': axes['years'][y], **dict(zip(FLOW_COLS, block[i, j].tolist()))}
+        for i, p in enumerate(p_pos) for j, y in enumerate(y_pos)
+    ]
+
+
+def query_product_month(arrays, axes, params):
+    p_pos = axis_positions(axes['products'], params.get('product'))
+    m_pos = (year_positions(axes['years'], params)[:, None] * 12 + np.arange(12)).ravel()
+    block = arrays['product_month'][np.ix_(p_pos, m_pos)]
+    return [
+        {'Product': axes['products'][p], 'Year': axes['years'][m // 12], 'Month': int(m % 12 + 1),
+         **dict(zip(FLOW_COLS, block[i, j].tolist()))}
+        for i, p in enumerate(p_pos) for j, m in enumerate(m_pos)
+    ]
+
+
+def query_region_year(arrays, axes, params):
+    r_pos = axis_positions(axes['regions'], params.get('region'))
+    y_pos = year_positions(axes['years'], params)
+    block = arrays['region_year'][np.ix_(r_pos, y_pos)]
+    return [
+        {'Region': axes['regions'][r], 'Year': axes['years'][y], 'Demand': float(block[i, j])}
+        for i, r in enumerate(r_pos) for j, y in enumerate(y_pos)
+    ]
+
+
+def query_product_region_quarter(arrays, axes, params):
+    p_pos = axis_positions(axes['products'], params.get('product'))
+    r_pos = axis_positions(axes['regions'], params.get('region'))
+    quarters = [int(q) for q in params.get('quarter', ['1', '2', '3', '4'])]
+    invalid = [q for q in quarters if not 1 <= q <= 4]
+    if invalid:
+        raise ValueError(f"номер квартала должен быть от 1 до 4: {', '.join(map(str, invalid))}")
+    q_pos = (year_positions(axes['years'], params)[:, None] * 4 + np.array(quarters, dtype=np.int64) - 1).ravel()
+    block = arrays['product_region_quarter'][np.ix_(p_pos, r_pos, q_pos)]
+    return [
+        {'Product': axes['products'][p], 'Region': axes['regions'][r], 'Year': axes['years'][q // 4],
+         'Quarter': int(q % 4 + 1), 'Demand': float(block[i, j, k])}
+        for i, p in enumerate(p_pos) for j, r in enumerate(r_pos) for k, q in enumerate(q_pos)
+    ]
+
+
+ROUTES = {
+    '/products/years': query_product_year,
+    '/products/months': query_product_month,
+    '/regions/years': query_region_year,
+    '/products/regions/quarters': query_product_region_quarter,
+}
+
+
+def make_handler(store):
+    class QueryHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, code, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            try:
+                arrays, axes = store.current()
+                if url.path == '/meta':
+                    return self.send_json(200, {'axes': axes, 'sources': store.fingerprint, 'builds': store.builds})
+                query = ROUTES.get(url.path)
+                if query is None:
+                    return self.send_json(404, {'error': f"неизвестный путь {url.path}", 'paths': ['/meta'] + list(ROUTES)})
+                rows = query(arrays, axes, params)
+                return self.send_json(200, {'rows': rows})
+            except (ValueError, KeyError) as e:
+                return self.send_json(400, {'error': str(e)})
+            except Exception as e:
+                return self.send_json(500, {'error': str(e)})
+
+    return QueryHandler
+
+
+def make_server(store, host=SERVICE_HOST, port=SERVICE_PORT):
+    return ThreadingHTTPServer((host, port), make_handler(store))
+
+
+def run_cli(argv=None):
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--host', default=SERVICE_HOST)
+    arg_parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    arg_parser.add_argument('--rebuild', action='store_true', help='пересчитать агрегаты при старте')
+    args = arg_parser.parse_args(argv)
+
+    store = RollupStore()
+    store.refresh(force=args.rebuild)
+    server = make_server(store, args.host, args.port)
+    print(f"Сервис запросов: http://{args.host}:{server.server_port}/meta")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run_cli()
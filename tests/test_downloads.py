@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+import parser
+import fake_customs
+
+
+@pytest.fixture
+def site(request):
+    params = getattr(request, 'param', {})
+    server, base_url, state = fake_customs.serve_fake_customs(**params)
+    yield base_url, state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(parser, 'RETRY_BACKOFF', 0)
+    return tmp_path
+
+
+def downloaded(flow):
+    folder = os.path.join(parser.DATA_DIR, flow)
+    return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+
+@pytest.mark.parametrize('site', [{'failures': {'/document_statistics_file/export_0.xlsx': 2,
+                                                '/statistic/eksport-rossii-vazhnejshix-tovarov?page=2': 1}}],
+                         indirect=True)
+def test_download_retries_5xx(site):
+    base_url, state = site
+    manifest = parser.load_download_manifest()
+    result = parser.download_customs_data(host=base_url, workers=4, rate=0, manifest=manifest)
+
+    assert len(result['export']) == 15
+    assert len(result['import']) == 15
+    assert state['hits']['/document_statistics_file/export_0.xlsx'] == 3
+    assert not [f for flow in ('export', 'import') for f in downloaded(flow) if f.endswith('.part')]
+    for path in result['export']:
+        with open(path, 'rb') as f:
+            assert f.read(4) == b'PK\x03\x04'
+
+
+@pytest.mark.parametrize('site', [{'failures': {'/document_statistics_file/export_1.xlsx': 100}}], indirect=True)
+def test_download_gives_up_on_persistent_5xx(site):
+    base_url, state = site
+    result = parser.download_customs_data(host=base_url, workers=2, rate=0,
+                                          manifest=parser.load_download_manifest())
+
+    assert len(result['export']) == 14
+    assert state['hits']['/document_statistics_file/export_1.xlsx'] == parser.RETRY_TOTAL + 1
+
+
+def test_second_run_uses_conditional_requests(site):
+    base_url, state = site
+    manifest = parser.load_download_manifest()
+    first = parser.download_customs_data(host=base_url, workers=2, rate=0, manifest=manifest)
+    mtimes = {p: os.path.getmtime(p) for p in first['export']}
+
+    second = parser.download_customs_data(host=base_url, workers=2, rate=0, manifest=manifest)
+
+    assert sorted(second['export']) == sorted(first['export'])
+    assert state['hits']['/document_statistics_file/export_0.xlsx'] == 2
+    assert {p: os.path.getmtime(p) for p in first['export']} == mtimes
+
+
+class BrokenResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, size):
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, **kwargs):
+        return self.response
+
+
+def test_interrupted_download_keeps_old_file(workdir):
+    target = os.path.join('data', 'old.xlsx')
+    os.makedirs('data')
+    with open(target, 'wb') as f:
+        f.write(b'PK\x03\x04old')
+
+    response = BrokenResponse([b'PK\x03\x04new', b'more', ConnectionError('reset')])
+    with pytest.raises(ConnectionError):
+        parser.fetch_with_manifest(FakeSession(response), 'http://host/old.xlsx', target, {'files': {}})
+
+    with open(target, 'rb') as f:
+        assert f.read() == b'PK\x03\x04old'
+    assert os.listdir('data') == ['old.xlsx']
+
+
+def test_html_instead_of_excel_is_not_saved(workdir):
+    target = os.path.join('data', 'file.xlsx')
+    os.makedirs('data')
+    response = BrokenResponse([b'<!doctype html><html>', b'error</html>'])
+    with pytest.raises(ValueError):
+        parser.fetch_with_manifest(FakeSession(response), 'http://host/file.xlsx', target, {'files': {}})
+    assert os.listdir('data') == []
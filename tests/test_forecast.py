@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import forecast
+
+SEASON_SHAPE = np.array([80, 85, 95, 100, 110, 120, 125, 120, 110, 100, 90, 85], dtype=np.float64)
+GAPS = [(2020, 3, 'Сталь'), (2021, 7, 'Сталь'), (2021, 8, 'Сталь'), (2020, 11, 'Трубы')]
+
+
+def seasonal_demand(years=range(2019, 2023)):
+    rows = [(y, m, product, SEASON_SHAPE[m - 1] * scale, 10.0 * scale, 5.0)
+            for y in years for m in range(1, 13) for product, scale in [('Сталь', 1.0), ('Трубы', 2.0)]]
+    return pd.DataFrame(rows, columns=['Year', 'Month', 'Product'] + forecast.FLOWS)
+
+
+def with_gaps(df):
+    df = df.copy()
+    for year, month, product in GAPS:
+        df.loc[(df['Year'] == year) & (df['Month'] == month) & (df['Product'] == product), 'Production'] = np.nan
+    return df
+
+
+def test_gaps_filled_from_seasonal_pattern():
+    df_full = seasonal_demand().set_index(['Year', 'Month', 'Product'])
+    df_out = forecast.build_forecast_table(with_gaps(seasonal_demand()), horizon=0)
+    df_out = df_out.set_index(['Year', 'Month', 'Product'])
+
+    for key in GAPS:
+        assert df_out.loc[key, 'Status'] == forecast.STATUS_FILLED
+        assert df_out.loc[key, 'Production'] == pytest.approx(df_full.loc[key, 'Production'], rel=0.02)
+    assert (df_out['Status'] == forecast.STATUS_FILLED).sum() == len(GAPS)
+
+
+def test_observed_values_unchanged():
+    df_in = with_gaps(seasonal_demand())
+    df_out = forecast.build_forecast_table(df_in, horizon=6)
+    df_hist = df_out[df_out['Status'] != forecast.STATUS_FORECAST].set_index(['Year', 'Month', 'Product'])
+    df_in = df_in.set_index(['Year', 'Month', 'Product']).loc[df_hist.index]
+
+    observed = df_in[forecast.FLOWS].notna().to_numpy()
+    assert np.array_equal(df_hist[forecast.FLOWS].to_numpy()[observed], df_in[forecast.FLOWS].to_numpy()[observed])
+    assert (df_hist['Status'] == forecast.STATUS_ACTUAL).sum() == len(df_hist) - len(GAPS)
+
+
+def test_forecast_covers_horizon_after_last_month():
+    df_out = forecast.build_forecast_table(seasonal_demand(), horizon=6)
+    df_fc = df_out[df_out['Status'] == forecast.STATUS_FORECAST]
+
+    assert len(df_fc) == 6 * 2
+    for product, scale in [('Сталь', 1.0), ('Трубы', 2.0)]:
+        rows = df_fc[df_fc['Product'] == product]
+        assert rows['Year'].tolist() == [2023] * 6
+        assert rows['Month'].tolist() == list(range(1, 7))
+        assert np.allclose(rows['Production'], SEASON_SHAPE[:6] * scale, rtol=0.01)
+        assert np.allclose(rows['Demand'], rows['Production'] + 10.0 * scale - 5.0)
@@ -0,0 +1,61 @@
+import os
+import io
+import json
+import shutil
+import contextlib
+
+import pandas as pd
+import pytest
+
+import benchmark
+import process_data
+
+
+def run_main(**kwargs):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        process_data.main(workers=1, **kwargs)
+    return out.getvalue()
+
+
+def read_final():
+    return pd.read_excel(process_data.OUTPUT_FILE)
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    benchmark.build_synthetic_archive(str(tmp_path), n_rows=40, xls_share=0.0, n_extra_products=5)
+    monkeypatch.chdir(tmp_path)
+    broken = os.path.join(process_data.BASE_DIR, 'import', 'import_2023_05_fixed.xlsx')
+    with open(broken, 'wb') as f:
+        f.write(process_data.ZIP_MAGIC + b'not a workbook')
+    return broken
+
+
+def test_unreadable_file_recorded_in_manifest(archive):
+    run_main()
+    with open(process_data.INPUTS_MANIFEST, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    entry = manifest['Import'][archive]
+    assert entry['status'] == 'error'
+    assert entry['digest'] == process_data.file_digest(archive)
+    assert entry['reason']
+    assert {e['status'] for path, e in manifest['Import'].items() if path != archive} == {'ok'}
+
+
+@pytest.mark.parametrize('action', ['remove', 'fix'])
+def test_fixing_unreadable_file_is_incremental(archive, action):
+    run_main()
+    if action == 'remove':
+        os.remove(archive)
+    else:
+        shutil.copy(os.path.join(process_data.BASE_DIR, 'import', 'import_2023_05.xlsx'), archive)
+
+    log = run_main(incremental=True)
+    assert 'Инкрементальное обновление' in log
+    assert 'полная пересборка' not in log
+    df_incremental = read_final()
+
+    run_main(use_cache=False)
+    pd.testing.assert_frame_equal(df_incremental.reset_index(drop=True), read_final().reset_index(drop=True))
@@ -0,0 +1,61 @@
+import os
+import io
+import sys
+import subprocess
+import contextlib
+
+import numpy as np
+import pytest
+
+import benchmark
+import mapping
+import process_data
+
+
+def test_registry_matches_linear_scan():
+    include_only = [(p, c) for p, c in benchmark.synthetic_mapping(2000) if c.isdigit()]
+    bridge_map = {}
+    for product, code in include_only:
+        bridge_map.setdefault(product, []).append(code)
+    registry = mapping.compile_registry(mapping.entries_from_dict(bridge_map))
+
+    rng = np.random.default_rng(0)
+    sample = [str(c) for c in rng.integers(10**9, 10**10, 500)] + [c + '12' for _, c in include_only[:500]]
+    for code in sample:
+        expected = tuple(p for p, targets in bridge_map.items() if process_data.is_code_match(code, targets))
+        assert process_data.match_code(code, registry) == tuple(sorted(expected, key=registry['products'].index))
+
+
+def test_matcher_comes_from_the_csv(tmp_path):
+    path = tmp_path / 'map.csv'
+    mapping.save_mapping([('Сталь, т', '7206'), ('Трубы, т', '7304-7306'), ('Трубы, т', 'кроме 730511')], str(path))
+    matcher = process_data.load_code_matcher(str(path))
+
+    assert matcher['products'] == ['Сталь, т', 'Трубы, т']
+    assert process_data.match_code('7206100000', matcher) == ('Сталь, т',)
+    assert process_data.match_code('7305110000', matcher) == ()
+    assert process_data.load_code_matcher(str(path)) is matcher
+
+
+def test_missing_or_empty_mapping_is_an_error(tmp_path, monkeypatch):
+    with pytest.raises(OSError):
+        process_data.load_code_matcher(str(tmp_path / 'missing.csv'))
+
+    empty = tmp_path / 'empty.csv'
+    mapping.save_mapping([], str(empty))
+    with pytest.raises(ValueError):
+        process_data.load_code_matcher(str(empty))
+
+    monkeypatch.chdir(tmp_path)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        process_data.main(workers=1, use_cache=False)
+    assert 'Не загружен справочник' in out.getvalue()
+    assert not os.path.exists(process_data.OUTPUT_FILE)
+
+
+def test_import_does_not_read_mapping(tmp_path):
+    code = f"import sys; sys.path.insert(0, {benchmark.SRC_DIR!r}); import process_data; print(len(process_data.CODE_MATCHERS))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '0'
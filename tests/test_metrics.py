@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import metrics
+import process_data
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, 'ENABLED', True)
+    monkeypatch.setattr(metrics, 'ROOT', metrics.Collector())
+    monkeypatch.setattr(metrics, 'CURRENT', metrics.contextvars.ContextVar('metrics_collector', default=metrics.ROOT))
+
+
+def test_concurrent_collectors_stay_separate():
+    barrier = threading.Barrier(2)
+
+    def work(name, n):
+        with metrics.collect() as collector:
+            barrier.wait()
+            for _ in range(n):
+                with metrics.stage(name):
+                    metrics.count(name)
+                    metrics.count('shared')
+        return collector.state()
+
+    with ThreadPoolExecutor(2) as executor:
+        first, second = executor.map(work, ['a', 'b'], [2000, 3000])
+
+    assert first['counters'] == {'a': 2000, 'shared': 2000}
+    assert second['counters'] == {'b': 3000, 'shared': 3000}
+    assert first['timings']['a'][0] == 2000 and 'b' not in first['timings']
+    assert metrics.ROOT.state() == {'timings': {}, 'counters': {}}
+
+
+def test_nested_collector_is_merged_into_parent():
+    with metrics.collect() as outer:
+        metrics.count('files')
+        with metrics.collect() as inner:
+            metrics.count('files', 2)
+        metrics.merge(inner.state())
+
+    assert inner.state()['counters'] == {'files': 2}
+    assert outer.state()['counters'] == {'files': 3}
+
+
+def test_parse_tasks_in_threads_report_their_own_metrics(tmp_path):
+    tasks = [(str(tmp_path / f"missing_{i}.xlsx"), 'Import', process_data.MAPPING_FILE, {}, False, True, False)
+             for i in range(20)]
+    with ThreadPoolExecutor(4) as executor:
+        outs = list(executor.map(process_data._timed_process_customs_file, tasks))
+
+    assert all(out['metrics']['counters'] == {'files': 1, 'records': 0} for out in outs)
+    assert metrics.ROOT.state()['counters'] == {}
@@ -0,0 +1,91 @@
+import io
+import asyncio
+import contextlib
+
+import numpy as np
+import pytest
+
+import benchmark
+import fake_customs
+import parser
+
+
+def test_electricity_shares_match_row_loop():
+    df_sheet = benchmark.synthetic_electricity_sheet(3000)
+    df_legacy = benchmark.legacy_electricity_shares(df_sheet)
+    df_new = parser.electricity_shares(df_sheet)
+
+    year_cols = parser.ELECTRICITY_YEAR_COLS
+    assert df_new['Регион'].tolist() == df_legacy['Регион'].tolist()
+    assert np.allclose(df_new[year_cols].to_numpy(dtype=np.float64),
+                       df_legacy[year_cols].to_numpy(dtype=np.float64), equal_nan=True, atol=1e-4)
+    assert not df_new['Регион'].isin(parser.ELECTRICITY_SKIP_REGIONS).any()
+
+
+def test_scale_thousands_matches_cell_loop():
+    df = benchmark.synthetic_production_sheet(200, 24)
+    df_legacy = benchmark.legacy_scale_thousands(df)
+    df_new = parser.scale_thousands(df)
+
+    assert df_new.astype(str).equals(df_legacy.astype(str))
+    assert df.astype(str).equals(benchmark.synthetic_production_sheet(200, 24).astype(str))
+
+
+CRAWL_PAGES = 300
+CRAWL_PER_PAGE = 20
+CRAWL_OVERLAP = 3
+
+
+@pytest.fixture
+def crawl(monkeypatch):
+    monkeypatch.setattr(parser, 'RETRY_BACKOFF', 0)
+    servers = []
+
+    def run(failures=None, workers=8):
+        server, host, state = fake_customs.serve_fake_customs(CRAWL_PAGES, CRAWL_PER_PAGE, CRAWL_OVERLAP, failures)
+        servers.append(server)
+        session = parser.make_session(parser.BROWSER_HEADERS, pool_size=workers)
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            found = asyncio.run(parser.crawl_listing(session, parser.HostRateLimiter(0), f"{host}/folder/515",
+                                                     host, workers))
+        return [u for u, _ in found], host, log.getvalue()
+
+    yield run
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_crawl_keeps_page_order_without_repeats(crawl):
+    links, host, _ = crawl()
+    session = parser.make_session(parser.BROWSER_HEADERS)
+    legacy = []
+    for page in range(1, 4):
+        for u in benchmark.legacy_find_excel_links(session, parser.listing_url(f"{host}/folder/515", page), host):
+            if u not in legacy:
+                legacy.append(u)
+
+    assert links[:len(legacy)] == legacy
+    assert links == [f"{host}{fake_customs.FILE_PREFIX}import_{i}.xlsx" for i in range(CRAWL_PAGES * CRAWL_PER_PAGE)]
+
+
+def test_failed_page_does_not_end_crawl(crawl):
+    page = CRAWL_PAGES // 2
+    links, host, log = crawl(failures={f'/folder/515?page={page}': 100})
+
+    # ссылки пропущенной страницы, которые не повторяются в начале следующей
+    lost = range((page - 1) * CRAWL_PER_PAGE, page * CRAWL_PER_PAGE - CRAWL_OVERLAP)
+    names = [u.rsplit('/', 1)[1] for u in links]
+    assert f'Страница {page} пропущена' in log
+    assert len(names) == len(set(names))
+    assert set(names) == {f"import_{i}.xlsx" for i in range(CRAWL_PAGES * CRAWL_PER_PAGE) if i not in lost}
+
+
+def test_failed_page_is_retried_after_pagination(crawl):
+    links, host, log = crawl(failures={f'/folder/515?page={CRAWL_PAGES // 2}': parser.RETRY_TOTAL + 1})
+
+    assert 'будет запрошена повторно' in log
+    assert 'пропущена' not in log
+    assert len(links) == CRAWL_PAGES * CRAWL_PER_PAGE
+    assert len(set(links)) == len(links)
@@ -0,0 +1,53 @@
+import io
+import os
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import benchmark
+import pipeline
+import process_data
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    benchmark.build_synthetic_archive(str(tmp_path), n_rows=20, xls_share=0.0, n_extra_products=5)
+    monkeypatch.chdir(tmp_path)
+    os.replace(os.path.join(process_data.BASE_DIR, 'production', 'Proizvodstvo_mes.xlsx'), pipeline.parser.PRODUCTION_OUTPUT)
+    return tmp_path
+
+
+def test_parse_stages_share_one_process_pool(archive, monkeypatch):
+    pools = []
+
+    class CountingPool(ProcessPoolExecutor):
+        def __init__(self, max_workers=None):
+            pools.append(max_workers)
+            super().__init__(max_workers=max_workers)
+
+    def no_own_pool(*args, **kwargs):
+        raise AssertionError('этап разбора запустил свой пул процессов')
+
+    monkeypatch.setattr(pipeline, 'ProcessPoolExecutor', CountingPool)
+    monkeypatch.setattr(process_data, 'ProcessPoolExecutor', no_own_pool)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        status = pipeline.run_pipeline(['merge'], jobs=3, workers=2)
+
+    assert pools == [2]
+    assert status == {'download.customs': 'skipped', 'download.production': 'skipped',
+                      'parse.import': 'done', 'parse.export': 'done', 'merge': 'done'}
+    assert os.path.exists(process_data.OUTPUT_FILE)
+
+
+def test_parse_stages_warm_layout_cache(archive):
+    learned = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for flow, type_name in [('import', 'Import'), ('export', 'Export')]:
+            process_data.collect_customs_outputs(pipeline.customs_files(flow), type_name, 1, use_cache=False,
+                                                 layouts=learned)
+        status = pipeline.run_pipeline(['parse.import', 'parse.export'], jobs=3)
+
+    assert status == {'download.customs': 'skipped', 'parse.import': 'done', 'parse.export': 'done'}
+    assert learned and sorted(process_data.load_layout_cache()) == sorted(learned)
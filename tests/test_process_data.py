@@ -0,0 +1,123 @@
+import io
+import os
+import zipfile
+import contextlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import metrics
+import process_data
+
+
+def test_final_table_matches_outer_merge():
+    df_prod, data_imp, data_exp = benchmark.synthetic_flow_records(50, range(2010, 2025))
+    df_legacy = benchmark.legacy_build_final_table(df_prod, data_imp, data_exp).reset_index(drop=True)
+    df_new = process_data.build_final_table(df_prod, process_data.records_frame(data_imp),
+                                            process_data.records_frame(data_exp)).reset_index(drop=True)
+
+    assert df_new['Product'].astype(str).tolist() == df_legacy['Product'].tolist()
+    assert df_new['Year'].tolist() == df_legacy['Year'].tolist()
+    assert df_new['Month'].tolist() == df_legacy['Month'].tolist()
+    assert np.allclose(df_new[process_data.FLOWS + ['Demand']].to_numpy(dtype=np.float64),
+                       df_legacy[process_data.FLOWS + ['Demand']].to_numpy(dtype=np.float64), equal_nan=True)
+
+
+def test_final_table_keeps_missing_production_and_fills_nothing():
+    df_prod = pd.DataFrame({'Year': [2020, 2020], 'Month': [1, 2], 'Product': ['Сталь, т', 'Сталь, т'],
+                            'Production': [np.nan, 5.0]})
+    df_imp = pd.DataFrame({'Year': [2020, 2020, 2016], 'Month': [1, 1, 1], 'Product': ['Сталь, т'] * 3,
+                           'Import': [1.0, 2.0, 7.0]})
+    df_final = process_data.build_final_table(df_prod, df_imp, pd.DataFrame()).reset_index(drop=True)
+
+    assert df_final['Product'].astype(str).tolist() == ['Сталь', 'Сталь']
+    assert df_final['Month'].tolist() == [1, 2]
+    assert np.isnan(df_final['Production'][0]) and df_final['Production'][1] == 5.0
+    assert df_final['Import'][0] == 3.0 and np.isnan(df_final['Import'][1])
+    assert df_final['Export'].isna().all()
+
+
+@pytest.fixture(scope='module')
+def heads(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('layouts'))
+    benchmark.build_synthetic_archive(root, range(2022, 2024), n_rows=20)
+    files = [f for flow in benchmark.FLOW_TITLES
+             for f in process_data.list_customs_files(os.path.join(root, process_data.BASE_DIR, flow))]
+    return [process_data.read_excel_head(f)[0] for f in files]
+
+
+def test_cached_layouts_match_full_detection(heads):
+    expected = [benchmark.legacy_detect_layout(df) for df in heads]
+    assert [process_data.detect_layout(df, {}) for df in heads] == expected
+
+    layouts = {}
+    for df in heads:
+        process_data.detect_layout(df, layouts)
+    stats = [{} for _ in heads]
+    assert [process_data.detect_layout(df, layouts, st) for df, st in zip(heads, stats)] == expected
+    assert all(st['layout'] == 'hit' for st in stats)
+
+
+def test_cached_layout_rejected_when_columns_change(heads):
+    df = heads[0].copy()
+    layouts = {}
+    header_row, code_col, weight_col = process_data.detect_layout(df, layouts)
+
+    moved = df.copy()
+    moved.iloc[header_row + 1, weight_col] = 'млн долл. США'
+    moved.iloc[header_row + 1, weight_col + 1] = 'тыс. тонн'
+    stats = {}
+    assert process_data.detect_layout(moved, layouts, stats) == (header_row, code_col, weight_col + 1)
+    assert stats['layout'] == 'mismatch'
+
+
+def test_cached_layout_rejected_when_later_weight_column_appears(heads):
+    df = heads[0].copy()
+    layouts = {}
+    header_row, code_col, weight_col = process_data.detect_layout(df, layouts)
+
+    later = df.copy()
+    later.iloc[header_row + 1, weight_col + 1] = 'тыс. тонн'
+    stats = {}
+    assert benchmark.legacy_detect_layout(later) == (header_row, code_col, weight_col + 1)
+    assert process_data.detect_layout(later, layouts, stats) == (header_row, code_col, weight_col + 1)
+    assert stats['layout'] == 'mismatch'
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / 'import_2023_01.xlsx')
+    pd.DataFrame({'code': ['7208', '7209'], 'weight': [1.5, 2.5]}).to_excel(path, index=False, header=False)
+    return path
+
+
+def test_column_reader_format_error_falls_back_to_full_read(workbook, monkeypatch):
+    def broken(*args):
+        raise zipfile.BadZipFile('bad central directory')
+
+    monkeypatch.setattr(metrics, 'ENABLED', True)
+    monkeypatch.setattr(process_data, '_read_xlsx_columns', broken)
+    log = io.StringIO()
+    with metrics.collect() as collector, contextlib.redirect_stdout(log):
+        df, error = process_data.read_excel_data_columns(workbook, [0, 1], 0)
+
+    assert error is None and df[1].tolist() == [1.5, 2.5]
+    assert collector.counters == {'columns_fallback': 1}
+    assert 'BadZipFile: bad central directory' in log.getvalue()
+
+
+def test_column_reader_bug_is_reported_not_retried(workbook, monkeypatch):
+    def broken(*args):
+        raise IndexError('column out of range')
+
+    def full_read(*args, **kwargs):
+        raise AssertionError('файл перечитан целиком')
+
+    monkeypatch.setattr(process_data, '_read_xlsx_columns', broken)
+    monkeypatch.setattr(process_data, 'read_excel_checked', full_read)
+    df, error = process_data.read_excel_data_columns(workbook, [0, 1], 0)
+
+    assert df is None
+    assert error == {'file': 'import_2023_01.xlsx', 'format': 'xlsx', 'reason': 'IndexError: column out of range'}
@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+import regional
+
+
+def test_allocate_demand_by_year_shares():
+    df_shares = pd.DataFrame({regional.REGION_COL: ['Север', 'Юг'], '2021': [40.0, 60.0], '2020': [25.0, 75.0]})
+    df_demand = pd.DataFrame({'Year': [2020, 2019, 2021, 2022], 'Month': [1, 1, 2, 3],
+                              'Product': ['Сталь'] * 4, 'Demand': [100.0, 10.0, 50.0, 70.0]})
+    df_res = regional.allocate_demand(df_demand, df_shares)
+
+    assert df_res['Year'].tolist() == [2020, 2020, 2021, 2021]
+    assert df_res['Month'].tolist() == [1, 1, 2, 2]
+    assert df_res['Region'].tolist() == ['Север', 'Юг', 'Север', 'Юг']
+    assert df_res['Share'].tolist() == pytest.approx([25.0, 75.0, 40.0, 60.0])
+    assert df_res['Demand'].tolist() == pytest.approx([25.0, 75.0, 20.0, 30.0])
+
+
+def test_allocate_demand_rejects_shares_without_years():
+    df_shares = pd.DataFrame({regional.REGION_COL: ['Север'], 'Доля': [100.0]})
+    df_demand = pd.DataFrame({'Year': [2020], 'Month': [1], 'Product': ['Сталь'], 'Demand': [1.0]})
+
+    with pytest.raises(ValueError, match='нет столбцов с годами'):
+        regional.allocate_demand(df_demand, df_shares)
@@ -0,0 +1,78 @@
+import io
+import json
+import time
+import threading
+import contextlib
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import outputs
+import service
+
+
+@pytest.fixture
+def served(tmp_path):
+    paths, df_demand, _ = benchmark.synthetic_query_sources(str(tmp_path), n_regions=10, n_products=4)
+    store = service.RollupStore(lambda: dict(paths), str(tmp_path / 'rollups'), check_interval=0.05)
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.current()
+    server = service.make_server(store, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", store, paths, df_demand
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    try:
+        with urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_yearly_sums_match_source(served):
+    host, _, _, df_demand = served
+    status, payload = get(host + '/products/years')
+    assert status == 200
+    got = pd.DataFrame(payload['rows']).groupby('Year')['Demand'].sum()
+    expected = df_demand.groupby('Year')['Demand'].sum()
+    assert np.allclose(got.loc[expected.index].to_numpy(), expected.to_numpy())
+
+
+def test_rollups_rebuilt_after_source_changes(served):
+    host, store, paths, df_demand = served
+    expected = df_demand.groupby('Year')['Demand'].sum()
+    time.sleep(store.check_interval)
+    df_demand['Demand'] *= 2
+    outputs.write_table(df_demand, paths['demand'][:-len('.feather')], ['feather'], outputs.DEMAND_DTYPES)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, payload = get(host + '/products/years')
+    got = pd.DataFrame(payload['rows']).groupby('Year')['Demand'].sum()
+    assert store.builds == 2
+    assert np.allclose(got.loc[expected.index].to_numpy(), expected.to_numpy() * 2)
+
+
+@pytest.mark.parametrize('quarter', ['0', '5', '-1', '12'])
+def test_quarter_out_of_range_is_rejected(served, quarter):
+    host, store, _, _ = served
+    arrays, axes = store.current()
+    with pytest.raises(ValueError):
+        service.query_product_region_quarter(arrays, axes, {'quarter': [quarter]})
+
+    status, payload = get(f"{host}/products/regions/quarters?quarter=2&quarter={quarter}")
+    assert status == 400
+    assert 'квартал' in payload['error']
+
+
+def test_quarter_selection(served):
+    host, _, _, _ = served
+    status, payload = get(f"{host}/products/regions/quarters?quarter=1&quarter=4")
+    assert status == 200
+    assert {row['Quarter'] for row in payload['rows']} == {1, 4}
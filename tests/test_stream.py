@@ -0,0 +1,73 @@
+import gc
+import os
+import io
+import contextlib
+
+import numpy as np
+
+import benchmark
+import process_data
+
+FILE_OVERHEAD = 4096
+
+
+def run_main(root, stream):
+    df, _, peak = benchmark.run_main_measured(str(root), stream=stream)
+    return df, peak
+
+
+def test_stream_matches_batch(tmp_path):
+    benchmark.build_synthetic_archive(str(tmp_path), range(2022, 2024), n_rows=60, n_extra_products=5)
+    df_batch, _ = run_main(tmp_path, stream=False)
+    df_stream, _ = run_main(tmp_path, stream=True)
+
+    assert len(df_batch) > 0
+    assert df_stream[process_data.KEY_COLS].equals(df_batch[process_data.KEY_COLS])
+    assert np.allclose(df_stream[process_data.FLOWS + ['Demand']].to_numpy(dtype=np.float64),
+                       df_batch[process_data.FLOWS + ['Demand']].to_numpy(dtype=np.float64), equal_nan=True)
+
+
+def test_accumulator_sums_and_missing_values():
+    acc = process_data.new_accumulator(['Сталь, т', 'Трубы, т'], years=(2020, 2021))
+    process_data.accumulate(acc, 'Import', [2020, 2020, 2020, 2021, 2019], [1, 1, 1, 2, 1], [0, 0, 1, 1, 0],
+                            [1.5, 2.5, np.nan, 4.0, 100.0])
+    process_data.accumulate(acc, 'Import', [2020], [1], [0], [0.25])
+    df = process_data.accumulator_table(acc).set_index(['Year', 'Month', 'Product'])['Import']
+
+    assert df[(2020, 1, 'Сталь')] == 4.25
+    assert df[(2020, 1, 'Трубы')] == 0.0
+    assert df[(2021, 2, 'Трубы')] == 4.0
+    assert len(df) == 3
+
+
+def stream_import_peak(root):
+    files = process_data.list_customs_files(os.path.join(root, process_data.BASE_DIR, 'import'))
+    mapping_path = os.path.join(root, process_data.MAPPING_FILE)
+    acc = process_data.new_accumulator(process_data.load_code_matcher(mapping_path)['products'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        outs, _, peak = benchmark.measure(process_data.collect_customs_outputs, files, 'Import', 1, False, None, acc,
+                                          mapping_path)
+    assert all(out['records'] is None and out['arrays'] is None for out in outs)
+    return peak, acc['rows']['Import'].sum()
+
+
+def test_stream_peak_memory_does_not_grow_with_years(tmp_path):
+    # книги xlrd держат циклические ссылки, и без частой сборки мусора пик зависит от того,
+    # сколько таких книг успело накопиться до очередного прохода gc
+    results = {}
+    threshold = gc.get_threshold()
+    gc.set_threshold(1)
+    try:
+        for n_years in (1, 1, 10):
+            root = str(tmp_path / str(n_years))
+            if not os.path.exists(root):
+                benchmark.build_synthetic_archive(root, range(2025 - n_years, 2025), n_rows=300, xls_share=1.0,
+                                                  n_extra_products=5)
+            results[n_years] = stream_import_peak(root)
+    finally:
+        gc.set_threshold(*threshold)
+
+    # на каждый файл остаются только строка журнала и статистика шаблона, а не его записи
+    extra_files = 12 * 9
+    assert results[10][1] > results[1][1] * 5
+    assert results[10][0] <= results[1][0] * (1 + benchmark.REGRESSION_TOLERANCE) + extra_files * FILE_OVERHEAD